@@ -84,7 +84,8 @@ def preview_image(image: Image) -> Dict[str, str]:
         "messages": messages,
         "model": "gpt-4o-mini",
         "json_mode": True,
-        "name": "captions: preview_image"
+        "name": "captions: preview_image",
+        "cacheName": "preview_image"
     }
     response = OpenAIService.completion(config=model_config)
     response_text = response.choices[0].message.content
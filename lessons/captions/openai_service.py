@@ -1,14 +1,27 @@
+import os
 import logging
 import json
+from pathlib import Path
 from typing import List, Dict, Union, Any, AsyncGenerator, Optional
 
 # from openai import OpenAI
 from langfuse.openai import openai
+from openai.types.chat import ChatCompletion
 import tiktoken
 from dotenv import load_dotenv, find_dotenv
 
+from completion_cache import CompletionCache, completion_cache_key
+
 load_dotenv(find_dotenv())
 
+# Cache of temperature=0 completions; only call sites listed here (with their TTL in seconds) use it
+COMPLETION_CACHE_TTLS = {
+    "preview_image": 7 * 24 * 3600,
+}
+completion_cache = CompletionCache(
+    Path(__file__).resolve().parent / "completion_cache.sqlite", 256
+) if os.getenv("COMPLETION_CACHE", "true").lower() == "true" else None
+
 class OpenAIService:
     def __init__(self):
         # self.openai = OpenAI()
@@ -62,6 +75,17 @@ class OpenAIService:
         stream = config.get('stream', False)
         json_mode = config.get('jsonMode', False)
         max_tokens = config.get('maxTokens', 8000)
+        response_format = {"type": "json_object"} if json_mode else {"type": "text"}
+
+        # Opt-in per call site: identical temperature=0 requests are answered from the cache
+        cache_name = config.get('cacheName')
+        cache_ttl = COMPLETION_CACHE_TTLS.get(cache_name) if cache_name else None
+        cache_key = None
+        if completion_cache and cache_ttl and not stream:
+            cache_key = completion_cache_key(model, messages, response_format, max_tokens)
+            cached = completion_cache.get(cache_key, cache_name)
+            if cached is not None:
+                return ChatCompletion.model_validate(cached)
 
         try:
             response = openai.chat.completions.create(
@@ -69,9 +93,11 @@ class OpenAIService:
                 messages=messages,
                 stream=stream,
                 max_tokens=max_tokens,
-                response_format = {"type": "json_object"} if json_mode else {"type": "text"},
+                response_format=response_format,
                 temperature=0,
             )
+            if cache_key:
+                completion_cache.put(cache_key, response.model_dump(), cache_ttl)
             return response
         except Exception as e:
             logging.error("Error in OpenAI completion:", exc_info=True)
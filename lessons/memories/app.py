@@ -1,11 +1,16 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import uuid
+import json
 import logging
 
 from openai_sevice import OpenAIService
 from assistant_service import AssistantService
 from memory_service import MemoryService
+from memory_watcher import MemoryWatcher
+from pipeline import Pipeline
+from config import config
 
 # Pydantic models for request and response
 class ChatCompletionMessageParam(BaseModel):
@@ -15,64 +20,95 @@ class ChatCompletionMessageParam(BaseModel):
 class ChatRequest(BaseModel):
     messages: list[ChatCompletionMessageParam]
     conversation_id: str = None
+    stream: bool = False
 
 # Initialize services
 openaiService = OpenAIService()
-memoryService = MemoryService('memory/memories', openaiService)
+memoryService = MemoryService(openaiService)
 assistantService = AssistantService(openaiService, memoryService)
+memoryWatcher = MemoryWatcher(memoryService)
 
 # Initialize FastAPI app
 app = FastAPI()
 
+async def stream_answer(stream, conversation_id: str):
+    try:
+        async for chunk in stream:
+            yield f"data: {json.dumps({**chunk.model_dump(), 'conversation_id': conversation_id})}\n\n"
+    except Exception as error:
+        logging.error('Error while streaming the answer:', exc_info=True)
+        yield f"data: {json.dumps({'error': 'An error occurred while streaming the answer'})}\n\n"
+    yield "data: [DONE]\n\n"
+
 @app.post("/api/chat")
 async def chat_endpoint(request: ChatRequest):
     messages = request.messages
     conversation_id = request.conversation_id or str(uuid.uuid4())
 
     # Filter out 'system' role messages
-    messages = [msg for msg in messages if msg.role != 'system']
+    messages = [msg.model_dump() for msg in messages if msg.role != 'system']
 
     try:
-        queries = await assistantService.extract_queries(messages)
-        memories = await memoryService.recall(queries)
-        should_learn = await assistantService.should_learn(messages, memories)
-        learnings = await assistantService.learn(messages, should_learn, memories)
-        answer = await assistantService.answer(
-            {
+        learn_in_background = config.LEARN_MODE == 'background'
+
+        async def answer(results):
+            return await assistantService.answer({
                 'messages': messages,
-                'memories': memories,
-                'knowledge': knowledge,
-                'learnings': learnings
-            }
+                'memories': results['memories'],
+                'learnings': '' if learn_in_background else results['learnings'],
+                'stream': request.stream
+            })
+
+        # Learning only needs the recalled memories, so in background mode it
+        # runs alongside the answer and finishes after the response is sent
+        pipeline = (
+            Pipeline('chat')
+            .add('queries', lambda results: assistantService.extract_queries(messages))
+            .add('memories', lambda results: memoryService.recall(results['queries']), deps=['queries'])
+            .add('should_learn', lambda results: assistantService.should_learn(messages, results['memories']),
+                 deps=['memories'], background=learn_in_background)
+            .add('learnings', lambda results: assistantService.learn(messages, results['should_learn'], results['memories']),
+                 deps=['should_learn'], background=learn_in_background)
+            .add('answer', answer, deps=['memories'] if learn_in_background else ['learnings'])
         )
+        results = await pipeline.run()
+
+        if openaiService.is_stream_response(results['answer']):
+            return StreamingResponse(
+                stream_answer(results['answer'], conversation_id),
+                media_type='text/event-stream'
+            )
 
-        return {**answer, 'conversation_id': conversation_id}
+        return {**results['answer'].model_dump(), 'conversation_id': conversation_id, 'timings': dict(pipeline.timings)}
 
     except Exception as error:
         logging.error('Error in chat processing:', exc_info=True)
         raise HTTPException(status_code=500, detail='An error occurred while processing your request')
 
-# @app.post("/api/sync")
-# async def sync_endpoint():
-#     trace = langfuseService.createTrace({
-#         'id': str(uuid.uuid4()),
-#         'name': 'Sync Memories',
-#         'sessionId': str(uuid.uuid4())
-#     })
-
-#     try:
-#         changes = await memoryService.sync_memories(trace)
-#         await langfuseService.finalizeTrace(trace, {}, changes)
-#         await langfuseService.flushAsync()
-#         return changes
-#     except Exception as error:
-#         await langfuseService.finalizeTrace(trace, {}, {'error': 'An error occurred while syncing memories'})
-#         logging.error('Error in memory synchronization:', exc_info=True)
-#         raise HTTPException(status_code=500, detail='An error occurred while syncing memories')
-
-# @app.on_event("shutdown")
-# async def shutdown_event():
-#     await langfuseService.shutdownAsync()
+@app.post("/api/sync")
+async def sync_endpoint():
+    try:
+        return await memoryService.sync_memories()
+    except Exception as error:
+        logging.error('Error in memory synchronization:', exc_info=True)
+        raise HTTPException(status_code=500, detail='An error occurred while syncing memories')
+
+@app.get("/api/stats")
+async def stats_endpoint():
+    return {
+        'prompt_cache': openaiService.get_prompt_cache_stats(),
+        'completion_cache': openaiService.completion_cache.get_stats() if openaiService.completion_cache else {}
+    }
+
+@app.on_event("startup")
+async def startup_event():
+    if config.WATCH_MEMORIES:
+        memoryWatcher.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await memoryWatcher.stop()
+    await openaiService.close()
 
 if __name__ == "__main__":
     import uvicorn
@@ -2,10 +2,12 @@ import uuid
 from typing import List, Dict, Any, Union, Optional
 from datetime import datetime
 import asyncio
+import logging
 
 import prompts
 from openai_sevice import OpenAIService
 from memory_service import MemoryService
+from config import config
 
 # Data classes for ParsingError and ShouldLearnResponse
 class ParsingError:
@@ -27,10 +29,10 @@ class AssistantService:
     async def extract_queries(self, messages: List[Dict[str, Any]]) -> List[str]:
         try:
             thread = [
-                {"role": "system", "content": prompts.extract_search_queries_prompt({"memoryStructure": prompts.memory_structure, "knowledge": prompts.default_knowledge})},
+                {"role": "system", "content": prompts.extract_search_queries_prompt()},
                 *messages
             ]
-            response = await self.openai_service.completion({"messages": thread, "jsonMode": True})
+            response = await self.openai_service.completion({"messages": thread, "jsonMode": True, "cacheName": "extract_queries"})
             result = self.openai_service.parse_json_response(response)
 
             if 'error' in result:
@@ -46,10 +48,7 @@ class AssistantService:
         thread = [
             {
                 "role": "system", 
-                "content": prompts.should_learn_prompt(
-                    memoryStructure=prompts.memory_structure,
-                    knowledge=prompts.default_knowledge, 
-                    memories=memories),
+                "content": prompts.should_learn_prompt(memories),
             },
             *messages
         ]
@@ -71,8 +70,14 @@ class AssistantService:
             return '<memory_modifications>\n<no_changes>No memories were added, updated, or deleted.</no_changes>\n</memory_modifications>'
 
         try:
-            add_results = await self.add_memories(should_learn_result.add, memories)
-            update_results = await self.update_memories(should_learn_result.update, memories)
+            novel, duplicate_results, routed_updates = await self.filter_near_duplicates(should_learn_result.add)
+            updates = should_learn_result.update + routed_updates
+            if config.LEARN_PLANNER == 'batched':
+                add_results, update_results = await self.plan_and_apply(novel, updates, memories)
+                add_results = duplicate_results + add_results
+            else:
+                add_results = duplicate_results + await self.add_memories(novel, memories)
+                update_results = await self.update_memories(updates, memories)
             memory_modifications = self.format_memory_modifications(add_results, update_results)
 
             return memory_modifications
@@ -80,6 +85,116 @@ class AssistantService:
             error_message = str(error)
             raise ValueError(error_message)
 
+    def validate_operation(self, operation: Dict[str, Any]) -> bool:
+        op = operation.get('op')
+        # New information can only be added or skipped; only changes to existing memories may update or delete
+        if op not in (('add', 'none') if operation['ref'].startswith('A') else ('update', 'delete', 'none')):
+            return False
+        if op == 'none':
+            return True
+        if op == 'delete':
+            return isinstance(operation.get('uuids'), list) and all(isinstance(u, str) for u in operation['uuids'])
+        memory = operation.get('memory')
+        if not isinstance(memory, dict):
+            return False
+        if not all(isinstance(memory.get(key), str) and memory[key] for key in ('category', 'subcategory', 'name')):
+            return False
+        if not isinstance(memory.get('content'), dict) or not isinstance(memory['content'].get('text'), str):
+            return False
+        return op == 'add' or memory.get('uuid') in self.memory_service.index
+
+    async def plan_and_apply(
+            self,
+            memories_to_add: List[str],
+            memories_to_update: List[Dict[str, Any]],
+            memories: str
+        ):
+        """
+        Plans all additions and updates with one structured completion and
+        applies the resulting operations. Items whose operation is missing
+        or invalid fall back to the per-item add/update calls.
+        """
+        if not memories_to_add and not memories_to_update:
+            return [], []
+        items = {f"A{i + 1}": content for i, content in enumerate(memories_to_add)}
+        items.update({f"U{i + 1}": update for i, update in enumerate(memories_to_update)})
+        thread = [
+            {
+                "role": "system",
+                "content": prompts.learn_plan_prompt(memories)
+            },
+            {
+                "role": "user",
+                "content": "Please process these items:\n" + "\n".join(f"{ref}: {item}" for ref, item in items.items())
+            }
+        ]
+        operations = {}
+        try:
+            thinking = await self.openai_service.completion({"messages": thread, "jsonMode": True})
+            result = self.openai_service.parse_json_response(thinking)
+            for operation in result.get('operations') or []:
+                if isinstance(operation, dict) and operation.get('ref') in items and self.validate_operation(operation):
+                    operations.setdefault(operation['ref'], operation)
+        except Exception as error:
+            logging.error(f"Learn planner failed, falling back to per-item calls: {error}")
+
+        async def apply(ref: str, operation: Dict[str, Any]) -> Dict[str, Any]:
+            content = str(items[ref])
+            try:
+                if operation['op'] == 'add':
+                    # A new memory gets a fresh identity, even if the planner copied one from
+                    # a recalled memory, so an add can never overwrite an existing memory
+                    memory_data = {key: value for key, value in operation['memory'].items()
+                                   if key not in ('uuid', 'created_at', 'updated_at')}
+                    memory = await self.memory_service.create_memory(memory_data)
+                    return {"status": "success", "name": memory.name, "uuid": memory.uuid, "content": content}
+                if operation['op'] == 'update':
+                    memory = await self.memory_service.update_memory(operation['memory'])
+                    return {"status": "success", "name": memory.name, "uuid": memory.uuid, "content": memory.content['text']}
+                if operation['op'] == 'delete':
+                    for uuid_to_delete in operation['uuids']:
+                        await self.memory_service.delete_memory(uuid_to_delete)
+                    return {"status": "deleted", "uuids": operation['uuids']}
+                return {"status": "no_action", "content": content}
+            except Exception as error:
+                return {"status": "failed", "content": content}
+
+        add_refs = [ref for ref in items if ref.startswith('A')]
+        update_refs = [ref for ref in items if ref.startswith('U')]
+        planned_adds, planned_updates, fallback_adds, fallback_updates = await asyncio.gather(
+            asyncio.gather(*(apply(ref, operations[ref]) for ref in add_refs if ref in operations)),
+            asyncio.gather(*(apply(ref, operations[ref]) for ref in update_refs if ref in operations)),
+            self.add_memories([items[ref] for ref in add_refs if ref not in operations], memories),
+            self.update_memories([items[ref] for ref in update_refs if ref not in operations], memories)
+        )
+        if len(operations) < len(items):
+            logging.info(f"Learn planner covered {len(operations)} of {len(items)} items, the rest used per-item calls")
+        return list(planned_adds) + fallback_adds, list(planned_updates) + fallback_updates
+
+    async def filter_near_duplicates(self, memories_to_add: Optional[List[str]]):
+        """
+        Checks candidate facts against stored memories before any LLM call.
+        Near-identical facts are dropped, close ones are routed to the update
+        path for the memory they resemble, and only the rest are added.
+        """
+        if not memories_to_add:
+            return [], [], []
+        try:
+            matches = await self.memory_service.find_closest_memories(memories_to_add)
+        except Exception as error:
+            logging.error(f"Near-duplicate check failed, adding all candidates: {error}")
+            return memories_to_add, [], []
+
+        novel, duplicates, updates = [], [], []
+        for content, match in zip(memories_to_add, matches):
+            if match and match.similarity >= config.LEARN_DUPLICATE_THRESHOLD:
+                duplicates.append({"status": "duplicate", "name": match.memory.name, "uuid": match.memory.uuid, "content": content})
+            elif match and match.similarity >= config.LEARN_UPDATE_THRESHOLD:
+                updates.append({"uuid": match.memory.uuid, "name": match.memory.name, "current": match.memory.content['text'], "new_information": content})
+            else:
+                novel.append(content)
+        return novel, duplicates, updates
+
     async def add_memories(self, memories_to_add: Optional[List[str]], memories: str) -> List[Dict[str, Any]]:
         if not memories_to_add:
             return []
@@ -88,11 +203,7 @@ class AssistantService:
             thread = [
                 {
                     "role": "system", 
-                    "content": prompts.learn_prompt(
-                        memory_structure=prompts.memory_structure, 
-                        knowledge=prompts.default_knowledge, 
-                        memories=memories
-                    )
+                    "content": prompts.learn_prompt(memories)
                 },
                 {
                     "role": "user", 
@@ -129,11 +240,7 @@ class AssistantService:
             thread = [
                 {
                     "role": "system", 
-                    "content": prompts.update_memory_prompt(
-                        memory_structure=prompts.memory_structure, 
-                        knowledge=prompts.default_knowledge, 
-                        memories=memories
-                    )
+                    "content": prompts.update_memory_prompt(memories)
                 },
                 {
                     "role": "user", 
@@ -166,7 +273,7 @@ class AssistantService:
         memory_modifications = "<memory_modifications>\n"
 
         for result in add_results:
-            memory_modifications += f'<added status="{result["status"]}" name="{result.get("name", "")}" uuid="{result.get("uuid", "")}">{result["content"]}</added>\n'
+            memory_modifications += f'<added status="{result["status"]}" name="{result.get("name", "")}" uuid="{result.get("uuid", "")}">{result.get("content", "")}</added>\n'
 
         for result in update_results:
             if result["status"] == "success":
@@ -184,34 +291,21 @@ class AssistantService:
 
         return memory_modifications
 
-    async def answer(self, config: Dict[str, Any], trace: LangfuseTraceClient):
+    async def answer(self, config: Dict[str, Any]):
         messages = config.get('messages', [])
         memories = config.get('memories', '')
-        knowledge = config.get('knowledge', defaultKnowledge)
+        knowledge = config.get('knowledge', prompts.default_knowledge)
         learnings = config.get('learnings', '')
         rest_config = {k: v for k, v in config.items() if k not in ['messages', 'memories', 'knowledge', 'learnings']}
 
-        system_message = {"role": "system", "content": f"As Alice, you're speaking to Adam. Answer based on the following memories:\n{memories} and general knowledge:\n{knowledge}. Learnings from the conversation:\n{learnings}"}
+        system_message = {"role": "system", "content": f"As Alice, you're speaking to Adam. Answer based on the following general knowledge:\n{knowledge}\n{prompts.environment_knowledge()}\n\nMemories:\n{memories}\n\nLearnings from the conversation:\n{learnings}"}
         messages_with_system = [system_message] + [msg for msg in messages if msg.get('role') != 'system']
 
-        generation = self.langfuse_service.create_generation(trace, "Answer", {"messages": messages_with_system, **rest_config})
-
-        try:
-            completion = await self.openai_service.completion({
-                **rest_config,
-                "messages": messages_with_system
-            })
-
-            self.langfuse_service.finalize_generation(generation, completion.choices[0].message, completion.model, {
-                "promptTokens": completion.usage.get("prompt_tokens") if completion.usage else None,
-                "completionTokens": completion.usage.get("completion_tokens") if completion.usage else None,
-                "totalTokens": completion.usage.get("total_tokens") if completion.usage else None,
-            })
-            return completion
-        except Exception as error:
-            self.langfuse_service.finalize_generation(generation, {"error": str(error)}, "unknown")
-            raise
+        return await self.openai_service.completion({
+            **rest_config,
+            "messages": messages_with_system
+        })
 
     async def get_relevant_context(self, query: str) -> str:
         similar_memories = await self.memory_service.search_similar_memories(query)
-        return '\n\n'.join(memory['content']['text'] for memory in similar_memories)
+        return '\n\n'.join(recalled.memory.content['text'] for recalled in similar_memories)
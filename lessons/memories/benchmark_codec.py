@@ -0,0 +1,67 @@
+import os
+import time
+import tempfile
+import argparse
+
+import yaml
+
+import frontmatter_codec
+
+
+def legacy_markdown_to_json(markdown: str) -> dict:
+    # The parser MemoryService used before frontmatter_codec
+    _, frontmatter, content = markdown.split('---')
+    data = yaml.safe_load(frontmatter.strip())
+    content_parts = content.strip().split('\n\n')
+    data['content'] = {'text': content_parts[0], 'hashtags': ' '.join(content_parts[1:]).strip()}
+    return data
+
+
+def make_memory(i: int) -> str:
+    frontmatter = {
+        'uuid': f'00000000-0000-0000-0000-{i:012d}',
+        'category': 'resources',
+        'subcategory': 'books',
+        'name': f'Memory {i}',
+        'metadata': {'confidence': 90, 'tags': ['book', 'reading list'], 'urls': [f'https://example.com/{i}']},
+        'created_at': '2024-10-01T12:00:00',
+        'updated_at': '2024-10-01T12:00:00',
+    }
+    return frontmatter_codec.dump(frontmatter, f'Adam wants to read book number {i}. ' * 5)
+
+
+def timed(label: str, fn, paths):
+    start = time.perf_counter()
+    for path in paths:
+        fn(path)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed * 1000:9.1f} ms  ({elapsed / len(paths) * 1e6:.1f} us/file)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare memory file parsing speed.")
+    parser.add_argument('--files', type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for i in range(args.files):
+            path = os.path.join(directory, f'{i}.md')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(make_memory(i))
+            paths.append(path)
+
+        def read(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                return f.read()
+
+        print(f"libyaml loader: {frontmatter_codec.Loader.__name__}")
+        timed('legacy (split + safe_load)', lambda path: legacy_markdown_to_json(read(path)), paths)
+        timed('frontmatter_codec.parse', lambda path: frontmatter_codec.parse(read(path)), paths)
+        cache = frontmatter_codec.FrontmatterCache()
+        timed('FrontmatterCache cold', cache.load, paths)
+        timed('FrontmatterCache warm', cache.load, paths)
+
+
+if __name__ == "__main__":
+    main()
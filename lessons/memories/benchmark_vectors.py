@@ -0,0 +1,61 @@
+import time
+import tempfile
+import argparse
+
+import numpy as np
+
+from vector_store import NumpyCollection
+
+
+def make_vectors(count: int, dims: int, seed: int = 0) -> np.ndarray:
+    # Clustered like real embeddings, so neighbours are meaningful and recall is not trivially 1
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(count // 100, 1), dims), dtype=np.float32)
+    vectors = centers[rng.integers(len(centers), size=count)]
+    vectors += 0.5 * rng.standard_normal((count, dims), dtype=np.float32)
+    return vectors
+
+
+def build(directory: str, vectors: np.ndarray, quantization=None) -> NumpyCollection:
+    collection = NumpyCollection(directory, vectors.shape[1], initial_capacity=len(vectors), quantization=quantization)
+    for i, vector in enumerate(vectors):
+        collection.upsert(str(i), vector)
+    collection.flush()
+    return collection
+
+
+def timed(label: str, search, queries: np.ndarray, k: int, repeat: int):
+    search(queries, k)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        search(queries, k)
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"{label:<20} {elapsed * 1000:9.1f} ms/batch  ({elapsed / len(queries) * 1000:.2f} ms/query)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare exact and int8 vector search latency and recall@k.")
+    parser.add_argument('--vectors', type=int, default=60000)
+    parser.add_argument('--dimensions', type=int, default=3072)
+    parser.add_argument('--queries', type=int, default=4)
+    parser.add_argument('--k', type=int, default=15)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    vectors = make_vectors(args.vectors, args.dimensions)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.integers(len(vectors), size=args.queries)]
+    queries = (queries + 0.3 * rng.standard_normal(queries.shape, dtype=np.float32)).tolist()
+
+    with tempfile.TemporaryDirectory() as directory:
+        collection = build(directory, vectors, quantization='int8')
+        del vectors
+        print(f"{args.vectors} x {args.dimensions} vectors, {args.queries} queries, k={args.k}")
+        print(f"float32 rows {collection.matrix.nbytes / 2**20:.0f} MB, int8 codes {collection.codes.nbytes / 2**20:.0f} MB")
+        timed('exact (float32)', lambda q, k: collection.search_batch(q, k, exact=True), queries, args.k, args.repeat)
+        timed('int8 + re-rank', collection.search_batch, queries, args.k, args.repeat)
+        print(f"int8 recall@{args.k}: {collection.recall_at_k(queries, args.k):.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -18,9 +18,47 @@ def os_env_mandatory(env_variable_name: str) -> Any:
 
 
 class Config:
-    APP_DIR = Path(__file__).resolve()
+    APP_DIR = Path(__file__).resolve().parent
     QDRANT_STORAGE = APP_DIR / "vectorstore"
+    VECTOR_STORAGE = APP_DIR / "vectors"
+    VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "numpy")
+    # None for exact float32 search, or "int8" for quantized search with float re-ranking
+    VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION") or None
+    VECTOR_RERANK_FACTOR = int(os.getenv("VECTOR_RERANK_FACTOR", 4))
+    # Size of stored embeddings; text-embedding-3-large can be shortened to e.g. 256, 512 or 1024
+    EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", 3072))
+    # When set, searches first rank on this many leading dimensions, then rescore on full vectors
+    VECTOR_COARSE_DIMENSIONS = int(os.getenv("VECTOR_COARSE_DIMENSIONS", 0)) or None
     MEMORIES = APP_DIR / "memories_contener"
+    INDEX_COMPACTION_MIN_RECORDS = 1000
+    INDEX_COMPACTION_GARBAGE_RATIO = 0.5
+    SYNC_CONCURRENCY = 32
+    WATCH_MEMORIES = os.getenv("WATCH_MEMORIES", "true").lower() == "true"
+    WATCH_DEBOUNCE = 0.5
+    WATCH_POLL_INTERVAL = 2.0
+    # Token budget for the <recalled_memories> block; 0 disables packing
+    RECALL_TOKEN_BUDGET = int(os.getenv("RECALL_TOKEN_BUDGET", 4000))
+    RECALL_MIN_TRUNCATED_TOKENS = 64
+    # "background" answers without waiting for learning, "inline" feeds learnings into the answer
+    LEARN_MODE = os.getenv("LEARN_MODE", "background")
+    # Cosine similarity above which a new fact is dropped / routed to an update of the existing memory
+    LEARN_DUPLICATE_THRESHOLD = 0.95
+    LEARN_UPDATE_THRESHOLD = 0.85
+    # "batched" plans all memory operations in one completion, "per_item" issues one per add/update
+    LEARN_PLANNER = os.getenv("LEARN_PLANNER", "batched")
+    EMBEDDING_CACHE = APP_DIR / "embedding_cache"
+    EMBEDDING_CACHE_MAX_ENTRIES = 50_000
+    EMBEDDING_CACHE_MEMORY_ENTRIES = 1024
+    OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", 16))
+    OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", 32))
+    OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", 60))
+    # Cache of temperature=0 completions; only call sites listed here (with their TTL in seconds) use it
+    COMPLETION_CACHE = os.getenv("COMPLETION_CACHE", "true").lower() == "true"
+    COMPLETION_CACHE_DB = APP_DIR / "completion_cache.sqlite"
+    COMPLETION_CACHE_MEMORY_ENTRIES = 1024
+    COMPLETION_CACHE_TTLS = {
+        "extract_queries": 300,
+    }
     
 
 config = Config()
\ No newline at end of file
@@ -0,0 +1,115 @@
+import os
+import json
+import mmap
+import hashlib
+from array import array
+from collections import OrderedDict
+from typing import List, Optional
+
+
+def embedding_cache_key(model: str, text: str) -> str:
+    return f"{model}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+
+class EmbeddingCache:
+    """
+    Disk-backed, content-addressed cache of embeddings for one vector size.
+
+    Vectors live as float32 rows in a memory-mapped file with a fixed number
+    of slots; a keys log next to it records which key owns which slot. When all slots are
+    taken, the least recently used key gives up its slot. A small in-memory
+    LRU sits in front to skip decoding for hot entries.
+    """
+
+    def __init__(self, directory: str, dim: int, max_entries: int, memory_entries: int):
+        self.dim = dim
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.row_size = dim * 4
+        os.makedirs(directory, exist_ok=True)
+        self.vectors_file = os.path.join(directory, f"vectors-{dim}.f32")
+        self.keys_file = os.path.join(directory, f"keys-{dim}.jsonl")
+
+        # key -> slot, ordered from least to most recently used
+        self.slots: OrderedDict[str, int] = OrderedDict()
+        self.memory: OrderedDict[str, List[float]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.load_keys()
+
+        size = self.max_entries * self.row_size
+        with open(self.vectors_file, 'ab') as f:
+            if f.tell() < size:
+                f.truncate(size)
+        self.file = open(self.vectors_file, 'r+b')
+        self.mmap = mmap.mmap(self.file.fileno(), size)
+
+    def load_keys(self):
+        owners = {}
+        if os.path.exists(self.keys_file):
+            with open(self.keys_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if record['slot'] < self.max_entries:
+                        owners[record['slot']] = record['key']
+        for slot, key in owners.items():
+            self.slots[key] = slot
+        self.free_slots = [slot for slot in range(self.max_entries - 1, -1, -1) if slot not in owners]
+        # Rewrite the key log so it does not grow with every slot reuse
+        with open(self.keys_file, 'w', encoding='utf-8') as f:
+            for key, slot in self.slots.items():
+                f.write(json.dumps({'key': key, 'slot': slot}) + '\n')
+
+    def get(self, key: str) -> Optional[List[float]]:
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.slots.move_to_end(key)
+            self.hits += 1
+            return self.memory[key]
+        slot = self.slots.get(key)
+        if slot is None:
+            self.misses += 1
+            return None
+        self.slots.move_to_end(key)
+        offset = slot * self.row_size
+        vector = array('f')
+        vector.frombytes(self.mmap[offset:offset + self.row_size])
+        embedding = vector.tolist()
+        self.remember(key, embedding)
+        self.hits += 1
+        return embedding
+
+    def put(self, key: str, embedding: List[float]):
+        if len(embedding) != self.dim:
+            raise ValueError(f"Expected embedding of size {self.dim}, got {len(embedding)}")
+        if key in self.slots:
+            slot = self.slots[key]
+            self.slots.move_to_end(key)
+        elif self.free_slots:
+            slot = self.free_slots.pop()
+            self.slots[key] = slot
+        else:
+            evicted_key, slot = self.slots.popitem(last=False)
+            self.memory.pop(evicted_key, None)
+            self.slots[key] = slot
+        offset = slot * self.row_size
+        self.mmap[offset:offset + self.row_size] = array('f', embedding).tobytes()
+        with open(self.keys_file, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'key': key, 'slot': slot}) + '\n')
+        self.remember(key, embedding)
+
+    def remember(self, key: str, embedding: List[float]):
+        self.memory[key] = embedding
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def close(self):
+        self.mmap.flush()
+        self.mmap.close()
+        self.file.close()
@@ -0,0 +1,103 @@
+import os
+import re
+from typing import Dict, Any, Tuple, Callable, Optional
+
+import yaml
+
+# The libyaml bindings are an order of magnitude faster than the pure-Python loader
+try:
+    from yaml import CSafeLoader as Loader, CSafeDumper as Dumper
+except ImportError:
+    from yaml import SafeLoader as Loader, SafeDumper as Dumper
+
+# Hand-edited files may use CRLF line endings
+FRONTMATTER_END = re.compile(r'^---[ \t]*\r?$', re.MULTILINE)
+HASHTAG = re.compile(r'#\S+')
+
+
+def split_frontmatter(markdown: str) -> Tuple[str, str]:
+    """
+    Splits a memory file into its YAML frontmatter and body. Only the first
+    closing '---' line ends the frontmatter, so '---' in the body is kept.
+    """
+    if not markdown.startswith('---'):
+        raise ValueError("Invalid markdown format")
+    start = markdown.find('\n') + 1
+    if start == 0:
+        raise ValueError("Invalid markdown format")
+    end = FRONTMATTER_END.search(markdown, start)
+    if not end:
+        raise ValueError("Invalid markdown format")
+    return markdown[start:end.start()], markdown[end.end():]
+
+
+def split_hashtags(body: str) -> Tuple[str, str]:
+    """
+    Separates the trailing hashtag paragraph written by dump() from the text.
+    """
+    text = body.strip()
+    head, sep, last = text.rpartition('\n\n')
+    if sep and last.strip() and all(HASHTAG.fullmatch(token) for token in last.split()):
+        return head.rstrip(), last.strip()
+    return text, ''
+
+
+def parse(markdown: str) -> Dict[str, Any]:
+    frontmatter, body = split_frontmatter(markdown)
+    body = body.replace('\r\n', '\n')
+    data = yaml.load(frontmatter, Loader=Loader) or {}
+    text, hashtags = split_hashtags(body)
+
+    # Ensure tags in metadata match those at the end of the file
+    if hashtags:
+        tags_from_content = [tag[1:].replace('_', ' ') for tag in hashtags.split()]
+        metadata = data.setdefault('metadata', {})
+        metadata['tags'] = list(dict.fromkeys((metadata.get('tags') or []) + tags_from_content))
+
+    data['content'] = {
+        'text': text,
+        'hashtags': hashtags
+    }
+    return data
+
+
+def dump(frontmatter_data: Dict[str, Any], text: str) -> str:
+    yaml_frontmatter = yaml.dump(frontmatter_data, Dumper=Dumper, allow_unicode=True)
+    markdown = f"---\n{yaml_frontmatter}---\n\n{text}"
+
+    # Add hashtags at the end of the file
+    tags = (frontmatter_data.get('metadata') or {}).get('tags', [])
+    if tags:
+        markdown += '\n\n' + ' '.join(f"#{tag.replace(' ', '_')}" for tag in tags)
+    return markdown
+
+
+class FrontmatterCache:
+    """
+    Parsed memory files keyed by path and invalidated by mtime and size, so
+    unchanged files are never re-read or re-parsed. With a factory, the
+    cache stores and returns the factory's (immutable) object as is.
+    """
+
+    def __init__(self, factory: Optional[Callable[[Dict[str, Any]], Any]] = None):
+        self.factory = factory
+        self.entries: Dict[str, Tuple[int, int, Any]] = {}
+
+    def load(self, path: str) -> Any:
+        stat = os.stat(path)
+        cached = self.entries.get(path)
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            data = cached[2]
+        else:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = parse(f.read())
+            if self.factory:
+                data = self.factory(data)
+            self.entries[path] = (stat.st_mtime_ns, stat.st_size, data)
+        if self.factory:
+            return data
+        # Callers get their own top-level dicts so they cannot corrupt the cache
+        return {**data, 'content': dict(data['content']), 'metadata': dict(data.get('metadata') or {})}
+
+    def invalidate(self, path: str):
+        self.entries.pop(path, None)
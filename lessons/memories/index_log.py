@@ -0,0 +1,160 @@
+import os
+import json
+import asyncio
+import logging
+import threading
+from typing import List, Dict, Any, Optional, Callable
+
+from config import config
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps_json(obj: Any) -> bytes:
+    """
+    Serializes to JSON bytes, with orjson when installed. Objects exposing
+    to_dict (such as Memory) are serialized through it.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=lambda o: o.to_dict())
+    return json.dumps(obj, default=lambda o: o.to_dict()).encode('utf-8')
+
+
+def loads_json(data):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+class IndexLog:
+    """
+    Append-only operation log behind index.jsonl.
+
+    Every mutation is a single appended record, either
+    {"op": "upsert", "memory": {...}} or {"op": "delete", "uuid": "..."}.
+    Replaying the log gives the current index. Once the log holds enough
+    superseded records it is compacted into a fresh file that is swapped in
+    with an atomic rename. Lines without an "op" key (the old plain index
+    format) are read as upserts.
+
+    An upsert may also carry the "file" the memory was written to, so the
+    sync manifest only has to be saved in bulk by a sync or a compaction.
+    load() collects the file records newer than that save in self.files.
+    """
+
+    def __init__(self, path: str,
+                 min_records: int = config.INDEX_COMPACTION_MIN_RECORDS,
+                 garbage_ratio: float = config.INDEX_COMPACTION_GARBAGE_RATIO):
+        self.path = path
+        self.min_records = min_records
+        self.garbage_ratio = garbage_ratio
+        self.records = 0
+        self.live = 0
+        self.lock = threading.Lock()
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.compaction_task: Optional[asyncio.Future] = None
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        entries: Dict[str, Dict[str, Any]] = {}
+        self.files = {}
+        self.records = 0
+        if os.path.exists(self.path):
+            with open(self.path, 'r+b') as f:
+                offset = 0
+                for line in f:
+                    start, offset = offset, offset + len(line)
+                    if not line.strip():
+                        continue
+                    try:
+                        record = loads_json(line)
+                    except ValueError:
+                        logging.warning(f"Skipping corrupt index record in {self.path}")
+                        if not line.endswith(b'\n'):
+                            # A torn last line from a crash mid-append; cut it off so the
+                            # next append starts on a line of its own
+                            f.truncate(start)
+                        continue
+                    if not line.endswith(b'\n'):
+                        f.write(b'\n')
+                    self.records += 1
+                    if record.get('op') == 'delete':
+                        entries.pop(record['uuid'], None)
+                        self.files.pop(record['uuid'], None)
+                    elif record.get('op') == 'upsert':
+                        entries[record['memory']['uuid']] = record['memory']
+                        if record.get('file'):
+                            self.files[record['memory']['uuid']] = record['file']
+                    else:
+                        entries[record['uuid']] = record
+        self.live = len(entries)
+        return entries
+
+    def append(self, record: Dict[str, Any]):
+        line = dumps_json(record) + b'\n'
+        with self.lock:
+            with open(self.path, 'ab') as f:
+                f.write(line)
+                f.flush()
+            self.records += 1
+
+    def upsert(self, memory: Any, is_new: bool, file: Optional[Dict[str, Any]] = None):
+        self.append({'op': 'upsert', 'memory': memory, 'file': file} if file else {'op': 'upsert', 'memory': memory})
+        if is_new:
+            self.live += 1
+
+    def delete(self, uuid_str: str):
+        self.append({'op': 'delete', 'uuid': uuid_str})
+        self.live -= 1
+
+    def needs_compaction(self) -> bool:
+        if self.records < self.min_records:
+            return False
+        garbage = self.records - self.live
+        return garbage / self.records >= self.garbage_ratio
+
+    def compact(self, entries: List[Any], offset: int, checkpoint: Optional[Callable[[], None]] = None):
+        """
+        Writes a snapshot of the live entries, then copies over whatever was
+        appended after the snapshot was taken and swaps the file in atomically.
+        The snapshot drops the file records, so the checkpoint (which saves
+        them elsewhere) runs first.
+        """
+        if checkpoint:
+            checkpoint()
+        tmp_path = f"{self.path}.compact"
+        with open(tmp_path, 'wb') as f:
+            for entry in entries:
+                f.write(dumps_json({'op': 'upsert', 'memory': entry}) + b'\n')
+            with self.lock:
+                with open(self.path, 'rb') as log:
+                    log.seek(offset)
+                    tail = log.read()
+                f.write(tail)
+                f.flush()
+                os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+                self.records = len(entries) + tail.count(b'\n')
+        logging.info(f"Compacted memory index to {self.records} records")
+
+    def maybe_compact(self, entries: Dict[str, Any], prepare_checkpoint: Optional[Callable[[], Callable[[], None]]] = None):
+        """
+        Runs compaction in a worker thread when the thresholds are met, so
+        the caller only ever pays for its own append. prepare_checkpoint is
+        called alongside the snapshot and returns the checkpoint to run in
+        the worker.
+        """
+        if not self.needs_compaction():
+            return
+        if self.compaction_task and not self.compaction_task.done():
+            return
+        with self.lock:
+            snapshot = list(entries.values())
+            offset = os.path.getsize(self.path)
+        checkpoint = prepare_checkpoint() if prepare_checkpoint else None
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.compact(snapshot, offset, checkpoint)
+            return
+        self.compaction_task = loop.run_in_executor(None, self.compact, snapshot, offset, checkpoint)
@@ -1,41 +1,87 @@
 import os
 import json
 import uuid
-import yaml
+import hashlib
 import asyncio
 import logging
+import threading
 from slugify import slugify
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Union
 from datetime import datetime
-import subprocess
+from dataclasses import dataclass, fields, replace
 
 from openai_sevice import OpenAIService
-from vector_store import QdrantService
+from vector_store import create_vector_store
+from index_log import IndexLog, dumps_json
+import frontmatter_codec
 from config import config
- 
 
+MEMORY_COLLECTION = 'memory'
+
+@dataclass(frozen=True, slots=True)
 class Memory:
-    def __init__(self, uuid: str, category: str, subcategory: str, name: str,
-                 content: Dict[str, Any], metadata: Dict[str, Any],
-                 created_at: str, updated_at: str):
-        self.uuid = uuid
-        self.category = category
-        self.subcategory = subcategory
-        self.name = name
-        self.content = content
-        self.metadata = metadata
-        self.created_at = created_at
-        self.updated_at = updated_at
+    """
+    Immutable memory record. Being frozen, one instance can be shared by the
+    index, the file cache and recall results without defensive copies.
+    """
+    uuid: str
+    category: str
+    subcategory: str
+    name: str
+    content: Dict[str, Any]
+    metadata: Dict[str, Any]
+    created_at: str
+    updated_at: str
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Memory':
+        return cls(
+            uuid=data['uuid'],
+            category=data['category'],
+            subcategory=data['subcategory'],
+            name=data['name'],
+            content=data['content'],
+            metadata=data.get('metadata') or {},
+            created_at=data['created_at'],
+            updated_at=data['updated_at']
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {field: getattr(self, field) for field in MEMORY_FIELDS}
+
+    def to_json_bytes(self) -> bytes:
+        return dumps_json(self)
+
+
+MEMORY_FIELDS = tuple(field.name for field in fields(Memory))
+
+
+@dataclass(frozen=True, slots=True)
+class RecalledMemory:
+    memory: Memory
+    similarity: float
+
 
 class MemoryService:
     def __init__(self, openai_service: OpenAIService = None):
         self.base_dir = config.MEMORIES
         self.index_file = os.path.join(self.base_dir, 'index.jsonl')
+        self.index_log = IndexLog(self.index_file)
         self.openai_service = openai_service
-        self.vector_store = QdrantService()  # Adjusted dimension for text-embedding-3-large
-        if not self.vector_store.client.collection_exist(collection_name='memory'):
-            self.vector_store.create_collection(name='memory', size=3072)
+        # Resident uuid -> index entry / file path maps, kept in sync with index.jsonl
+        self.index: Dict[str, Memory] = {}
+        self.file_paths: Dict[str, str] = {}
+        self.frontmatter_cache = frontmatter_codec.FrontmatterCache(Memory.from_dict)
+        self.manifest_file = os.path.join(self.base_dir, 'sync_manifest.json')
+        self.manifest = self.load_manifest()
+        self.manifest_lock = threading.Lock()
+        # The watcher, its polling loop and /api/sync can all start a sync
+        self.sync_lock = asyncio.Lock()
+        self.vector_store = create_vector_store()
+        if not self.vector_store.collection_exists(MEMORY_COLLECTION):
+            self.vector_store.create_collection(name=MEMORY_COLLECTION, size=config.EMBEDDING_DIMENSIONS)
         self.ensure_directories()
+        self.load_index()
 
     def ensure_directory_exists(self, dir_path: str):
         os.makedirs(dir_path, exist_ok=True)
@@ -56,51 +102,66 @@ class MemoryService:
             for subcategory in subcategories.get(category, []):
                 self.ensure_directory_exists(os.path.join(self.base_dir, category, subcategory))
 
-    def append_to_index(self, memory: Memory):
-        index_entry = json.dumps(memory.__dict__) + '\n'
-        with open(self.index_file, 'a', encoding='utf-8') as f:
-            f.write(index_entry)
+    def load_index(self):
+        self.index.clear()
+        self.file_paths.clear()
+        memories = [Memory.from_dict(memory_data) for memory_data in self.index_log.load().values()]
+        self.replay_file_records({memory.uuid for memory in memories})
+        # The manifest records where each memory actually lives, which for hand-written
+        # files need not be the slug of its name
+        for file, entry in self.manifest.items():
+            self.file_paths[entry['uuid']] = os.path.join(self.base_dir, file)
+        for memory in memories:
+            self.set_index_entry(memory)
+        for uuid_str in set(self.file_paths) - set(self.index):
+            del self.file_paths[uuid_str]
+
+    def set_index_entry(self, memory: Memory):
+        self.index[memory.uuid] = memory
+        if memory.uuid not in self.file_paths:
+            self.file_paths[memory.uuid] = self.get_memory_file_path(memory)
+
+    def remove_index_entry(self, uuid_str: str):
+        self.index.pop(uuid_str, None)
+        self.file_paths.pop(uuid_str, None)
+
+    def append_to_index(self, memory: Memory, file: Optional[Dict[str, Any]] = None):
+        self.index_log.upsert(memory, is_new=memory.uuid not in self.index, file=file)
+        self.set_index_entry(memory)
+        self.index_log.maybe_compact(self.index, self.prepare_manifest_checkpoint)
+
+    def remove_from_index(self, uuid_str: str):
+        if uuid_str not in self.index:
+            return
+        self.index_log.delete(uuid_str)
+        self.remove_index_entry(uuid_str)
+        self.index_log.maybe_compact(self.index, self.prepare_manifest_checkpoint)
 
     def json_to_markdown(self, memory: Memory) -> str:
-        content = memory.content
-        frontmatter_data = memory.__dict__.copy()
-        del frontmatter_data['content']
-
-        yaml_frontmatter = yaml.dump(frontmatter_data, allow_unicode=True)
-
-        markdown_content = f"---\n{yaml_frontmatter}---\n\n{content['text']}"
-
-        # Add hashtags at the end of the file
-        tags = frontmatter_data.get('metadata', {}).get('tags', [])
-        if tags:
-            markdown_content += '\n\n' + ' '.join(f"#{tag.replace(' ', '_')}" for tag in tags)
-
-        return markdown_content
+        frontmatter_data = memory.to_dict()
+        content = frontmatter_data.pop('content')
+        return frontmatter_codec.dump(frontmatter_data, content['text'])
 
     def markdown_to_json(self, markdown: str) -> Memory:
-        parts = markdown.split('---')
-        if len(parts) < 3:
-            raise ValueError("Invalid markdown format")
-        _, frontmatter, content = parts
-        data = yaml.safe_load(frontmatter.strip())
-
-        # Split content into main text and hashtags
-        content_parts = content.strip().split('\n\n')
-        main_content = content_parts[0]
-        hashtags = ' '.join(content_parts[1:]).strip()
-
-        # Ensure tags in metadata match those at the end of the file
-        if hashtags:
-            tags_from_content = [tag.replace('#', '').replace('_', ' ') for tag in hashtags.split(' ')]
-            data.setdefault('metadata', {})
-            data['metadata']['tags'] = list(set(data['metadata'].get('tags', []) + tags_from_content))
-
-        data['content'] = {
-            'text': main_content,
-            'hashtags': hashtags  # Store hashtags separately if needed
-        }
-
-        return Memory(**data)
+        return Memory.from_dict(frontmatter_codec.parse(markdown))
+
+    def load_memory_file(self, file_path: str) -> Memory:
+        return self.frontmatter_cache.load(file_path)
+
+    def load_all_memories(self):
+        """
+        Streams every memory file under the base directory through the
+        frontmatter cache, skipping files that fail to parse.
+        """
+        for root, _, file_names in os.walk(self.base_dir):
+            for file_name in file_names:
+                if not file_name.endswith('.md'):
+                    continue
+                file_path = os.path.join(root, file_name)
+                try:
+                    yield self.load_memory_file(file_path)
+                except Exception as e:
+                    logging.error(f"Error loading memory file {file_path}: {e}")
 
     def get_memory_file_path(self, memory: Memory) -> str:
         slugified_name = slugify(memory.name, lowercase=True)
@@ -112,17 +173,17 @@ class MemoryService:
         )
 
     async def create_memory(self, memory_data: Dict[str, Any]) -> Memory:
-        new_memory = Memory(
-            uuid=str(uuid.uuid4()),
-            created_at=datetime.utcnow().isoformat(),
-            updated_at=datetime.utcnow().isoformat(),
+        new_memory = Memory.from_dict({
+            'uuid': str(uuid.uuid4()),
+            'created_at': datetime.utcnow().isoformat(),
+            'updated_at': datetime.utcnow().isoformat(),
             **memory_data
-        )
+        })
         try:
             embedding = await self.openai_service.create_embedding(new_memory.content['text'])
 
             # Add the embedding to the vector store
-            self.vector_store.add_point(new_memory.uuid, embedding)
+            self.vector_store.add_point(MEMORY_COLLECTION, new_memory.uuid, embedding)
 
             dir_path = os.path.join(
                 self.base_dir,
@@ -136,8 +197,9 @@ class MemoryService:
 
             with open(file_path, 'w', encoding='utf-8') as f:
                 f.write(markdown_content)
+            file = self.record_file(file_path, new_memory.uuid, markdown_content)
 
-            self.append_to_index(new_memory)
+            self.append_to_index(new_memory, file)
 
             return new_memory
         except Exception as e:
@@ -145,46 +207,38 @@ class MemoryService:
 
     async def get_memory(self, uuid_str: str) -> Optional[Memory]:
         try:
-            with open(self.index_file, 'r', encoding='utf-8') as f:
-                memories = [json.loads(line) for line in f if line.strip()]
-            memory_data = next((m for m in memories if m['uuid'] == uuid_str), None)
-            if not memory_data:
+            file_path = self.file_paths.get(uuid_str)
+            if not file_path:
                 return None
 
-            file_path = self.get_memory_file_path(Memory(**memory_data))
-            with open(file_path, 'r', encoding='utf-8') as f:
-                file_content = f.read()
-            return self.markdown_to_json(file_content)
+            return self.load_memory_file(file_path)
         except Exception as e:
             logging.error(f"Error reading memory: {e}")
             return None
 
-    async def update_memory(self, memory: Memory) -> Memory:
+    async def update_memory(self, memory: Union[Memory, Dict[str, Any]]) -> Memory:
         try:
-            memory.updated_at = datetime.utcnow().isoformat()
-            file_path = self.get_memory_file_path(memory)
+            if isinstance(memory, dict):
+                # Updates planned by the LLM may only carry the changed fields
+                existing = self.index.get(memory.get('uuid'))
+                memory = Memory.from_dict({**(existing.to_dict() if existing else {}), 'updated_at': '', **memory})
+            memory = replace(memory, updated_at=datetime.utcnow().isoformat())
+            # Update the file the memory already lives in, whatever its name
+            file_path = self.file_paths.get(memory.uuid) or self.get_memory_file_path(memory)
+            self.ensure_directory_exists(os.path.dirname(file_path))
             markdown_content = self.json_to_markdown(memory)
 
             with open(file_path, 'w', encoding='utf-8') as f:
                 f.write(markdown_content)
+            file = self.record_file(file_path, memory.uuid, markdown_content)
 
             # Update the embedding if the content has changed
-            old_memory = await self.get_memory(memory.uuid)
+            old_memory = self.index.get(memory.uuid)
             if old_memory and old_memory.content['text'] != memory.content['text']:
                 new_embedding = await self.openai_service.create_embedding(memory.content['text'])
-                self.vector_store.update(new_embedding, memory.uuid)
-
-            # Update index file
-            with open(self.index_file, 'r', encoding='utf-8') as f:
-                index_lines = f.readlines()
-            with open(self.index_file, 'w', encoding='utf-8') as f:
-                for line in index_lines:
-                    if line.strip():
-                        indexed_memory = json.loads(line)
-                        if indexed_memory['uuid'] == memory.uuid:
-                            f.write(json.dumps(memory.__dict__) + '\n')
-                        else:
-                            f.write(line)
+                self.vector_store.update_point(MEMORY_COLLECTION, memory.uuid, new_embedding)
+
+            self.append_to_index(memory, file)
             return memory
         except Exception as e:
             logging.error(f"Error updating memory: {e}")
@@ -192,26 +246,24 @@ class MemoryService:
 
     async def search_memories(self, query: str) -> List[Memory]:
         try:
-            with open(self.index_file, 'r', encoding='utf-8') as f:
-                memories = [json.loads(line) for line in f if line.strip()]
             return [
-                Memory(**memory) for memory in memories
-                if query.lower() in memory['name'].lower() or query.lower() in memory['content']['text'].lower()
+                memory for memory in self.index.values()
+                if query.lower() in memory.name.lower() or query.lower() in memory.content['text'].lower()
             ]
         except Exception as e:
             logging.error(f"Error searching memories: {e}")
             return []
 
-    async def search_similar_memories(self, query: str, k: int = 15) -> List[Dict[str, Any]]:
+    async def search_similar_memories(self, query: str, k: int = 15) -> List[RecalledMemory]:
         try:
             query_embedding = await self.openai_service.create_embedding(query)
-            similar_results = self.vector_store.search(query_embedding, k)
+            similar_results = self.vector_store.search(MEMORY_COLLECTION, query_embedding, k)
             if not similar_results:
                 logging.info('No similar memories found.')
                 return []
             memories = await asyncio.gather(*(self.get_memory(result['id']) for result in similar_results))
             return [
-                {**memory.__dict__, 'similarity': similar_results[index]['similarity']}
+                RecalledMemory(memory, similar_results[index]['similarity'])
                 for index, memory in enumerate(memories) if memory
             ]
         except Exception as e:
@@ -224,32 +276,102 @@ class MemoryService:
             if not memory:
                 return False
 
-            file_path = self.get_memory_file_path(memory)
+            file_path = self.file_paths.get(uuid_str) or self.get_memory_file_path(memory)
             os.remove(file_path)
+            self.frontmatter_cache.invalidate(file_path)
+            self.manifest.pop(os.path.relpath(file_path, self.base_dir), None)
+            self.vector_store.delete_point(MEMORY_COLLECTION, uuid_str)
 
-            # Update the index file
-            with open(self.index_file, 'r', encoding='utf-8') as f:
-                index_lines = f.readlines()
-            with open(self.index_file, 'w', encoding='utf-8') as f:
-                for line in index_lines:
-                    if line.strip():
-                        indexed_memory = json.loads(line)
-                        if indexed_memory['uuid'] != uuid_str:
-                            f.write(line)
+            self.remove_from_index(uuid_str)
             return True
         except Exception as e:
             logging.error(f"Error deleting memory: {e}")
             return False
 
-    async def recall(self, queries: List[str]) -> str:
+    def fuse_search_results(self, results: List[List[Dict[str, Any]]], fusion: str = 'max', rrf_k: int = 60) -> List[Dict[str, Any]]:
+        """
+        Merges per-query hits into one list ordered by fused score. 'max' keeps
+        each memory's best similarity; 'rrf' sums reciprocal ranks across queries.
+        """
+        fused: Dict[str, Dict[str, Any]] = {}
+        for hits in results:
+            for rank, hit in enumerate(hits):
+                entry = fused.setdefault(hit['id'], {'id': hit['id'], 'similarity': hit['similarity'], 'score': 0.0})
+                entry['similarity'] = max(entry['similarity'], hit['similarity'])
+                if fusion == 'rrf':
+                    entry['score'] += 1 / (rrf_k + rank + 1)
+                else:
+                    entry['score'] = entry['similarity']
+        return sorted(fused.values(), key=lambda entry: entry['score'], reverse=True)
+
+    async def search_similar_memories_batch(self, queries: List[str], k: int = 15, fusion: str = 'max') -> List[RecalledMemory]:
+        """
+        Embeds all queries in one call, searches them in one vector store
+        request and loads every distinct hit once.
+        """
+        if not queries:
+            return []
+        query_embeddings = await self.openai_service.create_embeddings(queries)
+        results = self.vector_store.search_batch(MEMORY_COLLECTION, query_embeddings, k)
+        hits = self.fuse_search_results(results, fusion)
+        memories = await asyncio.gather(*(self.get_memory(hit['id']) for hit in hits))
+        return [
+            RecalledMemory(memory, hit['similarity'])
+            for hit, memory in zip(hits, memories) if memory
+        ]
+
+    def pack_memories(self, recalled_memories: List[RecalledMemory], token_budget: int) -> List[str]:
+        """
+        Greedily takes memories in score order until the token budget is
+        spent. The first memory that does not fit is truncated into the
+        remaining space when enough is left, and the rest are dropped.
+        """
+        packed, used = [], 0
+        for recalled in recalled_memories:
+            formatted = self.format_memory(recalled.memory)
+            tokens = self.openai_service.count_text_tokens(formatted)
+            if used + tokens <= token_budget:
+                packed.append(formatted)
+                used += tokens
+                continue
+            remaining = token_budget - used
+            overhead = self.openai_service.count_text_tokens(self.format_memory(recalled.memory, text=''))
+            if remaining - overhead >= config.RECALL_MIN_TRUNCATED_TOKENS:
+                text = self.openai_service.truncate_to_tokens(recalled.memory.content['text'], remaining - overhead - 1)
+                formatted = self.format_memory(recalled.memory, text=f"{text}…")
+                packed.append(formatted)
+                used += self.openai_service.count_text_tokens(formatted)
+            break
+        logging.info(f"Packed {len(packed)} of {len(recalled_memories)} recalled memories into {used}/{token_budget} tokens")
+        return packed
+
+    async def find_closest_memories(self, texts: List[str]) -> List[Optional[RecalledMemory]]:
+        """
+        Returns the single most similar stored memory for each text, embedding
+        all texts in one call and searching them in one batch.
+        """
+        if not texts:
+            return []
+        embeddings = await self.openai_service.create_embeddings(texts)
+        results = self.vector_store.search_batch(MEMORY_COLLECTION, embeddings, 1)
+        closest = []
+        for hits in results:
+            memory = self.index.get(hits[0]['id']) if hits else None
+            closest.append(RecalledMemory(memory, hits[0]['similarity']) if memory else None)
+        return closest
+
+    async def recall(self, queries: List[str], fusion: str = 'max', token_budget: Optional[int] = config.RECALL_TOKEN_BUDGET) -> str:
         try:
-            recalled_memories_lists = await asyncio.gather(*(self.search_similar_memories(query) for query in queries))
-            unique_memories = {memory['uuid']: memory for memories in recalled_memories_lists for memory in memories}.values()
+            unique_memories = await self.search_similar_memories_batch(queries, fusion=fusion)
 
             if not unique_memories:
                 result = '<recalled_memories>No relevant memories found.</recalled_memories>'
             else:
-                formatted_memories = '\n'.join(self.format_memory(Memory(**memory)) for memory in unique_memories)
+                if token_budget:
+                    formatted = self.pack_memories(unique_memories, token_budget)
+                else:
+                    formatted = [self.format_memory(recalled.memory) for recalled in unique_memories]
+                formatted_memories = '\n'.join(formatted)
                 result = f"<recalled_memories>\n{formatted_memories}</recalled_memories>"
 
             logging.info(f'Recalled memories: {result}')
@@ -259,97 +381,157 @@ class MemoryService:
             error_result = f"<recalled_memories>Error: {error_message}</recalled_memories>"
             raise ValueError(error_result)
 
-    def format_memory(self, memory: Memory) -> str:
+    def format_memory(self, memory: Memory, text: Optional[str] = None) -> str:
         urls = memory.metadata.get('urls', [])
         urls_str = f"\nURLs: {', '.join(urls)}" if urls else ''
         return (
             f'<memory uuid="{memory.uuid}" name="{memory.name}" category="{memory.category}" '
             f'subcategory="{memory.subcategory}" lastmodified="{memory.updated_at}">'
-            f'{memory.content["text"]}{urls_str}</memory>'
+            f'{memory.content["text"] if text is None else text}{urls_str}</memory>'
         )
 
-    async def sync_memories(self, trace: LangfuseTraceClient) -> Dict[str, List[str]]:
-        git_diff = self.get_git_diff()
-        changes = self.parse_git_diff(git_diff)
-
+    def load_manifest(self) -> Dict[str, Dict[str, Any]]:
+        if not os.path.exists(self.manifest_file):
+            return {}
+        try:
+            with open(self.manifest_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logging.error(f"Error reading sync manifest, rescanning all files: {e}")
+            return {}
+
+    def save_manifest(self, manifest: Optional[Dict[str, Dict[str, Any]]] = None):
+        # Called from the loop by a sync and from the compaction worker
+        with self.manifest_lock:
+            tmp_path = f"{self.manifest_file}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.manifest if manifest is None else manifest, f)
+            os.replace(tmp_path, self.manifest_file)
+
+    def prepare_manifest_checkpoint(self):
+        """
+        Compacting the index drops the file records of single writes, so the
+        manifest is saved along with it: copied here, written by the worker.
+        """
+        manifest = {file: dict(entry) for file, entry in self.manifest.items()}
+        return lambda: self.save_manifest(manifest)
+
+    def record_file(self, file_path: str, uuid_str: str, content: str) -> Dict[str, Any]:
+        """
+        Updates the manifest entry for a file and returns it as the file
+        record that goes into the index log with the memory.
+        """
+        file = os.path.relpath(file_path, self.base_dir)
+        self.manifest[file] = {
+            'uuid': uuid_str,
+            'hash': hashlib.sha256(content.encode('utf-8')).hexdigest(),
+            'mtime': os.path.getmtime(file_path)
+        }
+        return {'path': file, 'hash': self.manifest[file]['hash'], 'mtime': self.manifest[file]['mtime']}
+
+    def replay_file_records(self, live_uuids: set):
+        """
+        Brings the saved manifest up to date with the index log: files of
+        deleted memories are dropped and files written since the last save
+        (recorded in the log) replace any older path of the same memory.
+        """
+        files = self.index_log.files
+        for file in [file for file, entry in self.manifest.items()
+                     if entry['uuid'] not in live_uuids
+                     or (entry['uuid'] in files and files[entry['uuid']]['path'] != file)]:
+            del self.manifest[file]
+        for uuid_str, record in files.items():
+            self.manifest[record['path']] = {'uuid': uuid_str, 'hash': record['hash'], 'mtime': record['mtime']}
+
+    def scan_memory_files(self) -> Dict[str, float]:
+        files = {}
+        for root, _, file_names in os.walk(self.base_dir):
+            for file_name in file_names:
+                if file_name.endswith('.md'):
+                    file_path = os.path.join(root, file_name)
+                    files[os.path.relpath(file_path, self.base_dir)] = os.path.getmtime(file_path)
+        return files
+
+    def read_memory_file(self, file: str):
+        with open(os.path.join(self.base_dir, file), 'r', encoding='utf-8') as f:
+            content = f.read()
+        return content, hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    async def sync_memories(self) -> Dict[str, List[str]]:
+        """
+        Brings the index and vector store in line with the markdown files.
+
+        A manifest of path -> (uuid, content hash, mtime) lets files with an
+        unchanged mtime be skipped without reading them, and files whose
+        content hash is unchanged be skipped without parsing them.
+        """
+        async with self.sync_lock:
+            files = self.scan_memory_files()
+            candidates = [file for file, mtime in files.items()
+                          if file not in self.manifest or self.manifest[file]['mtime'] != mtime]
+            deleted_files = [file for file in self.manifest if file not in files]
+            changes = await self.apply_file_changes(candidates, deleted_files)
         logging.info(f"Changes detected: {changes}")
-        added = []
-        modified = []
-        deleted = []
-
-        for file in changes['added']:
-            memory = await self.add_memory_from_file(file)
-            if memory:
-                added.append(memory.uuid)
-
-        for file in changes['modified']:
-            logging.info(f'Updating file {file}')
-            memory = await self.update_memory_from_file(file)
-            if memory:
-                modified.append(memory.uuid)
-
-        for file in changes['deleted']:
-            success = await self.delete_memory_by_file(file)
-            if success:
-                deleted.append(file)
-
-        self.langfuse_service.create_event(trace, "SyncMemories", {"added": added, "modified": modified, "deleted": deleted})
-        return {"added": added, "modified": modified, "deleted": deleted}
-
-    def get_git_diff(self) -> str:
-        command = ['git', 'diff', '--name-status', 'HEAD']
-        result = subprocess.run(command, cwd=self.base_dir, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        if result.returncode != 0:
-            logging.error(f"Git diff error: {result.stderr}")
-            return ''
-        return result.stdout
-
-    def parse_git_diff(self, diff: str) -> Dict[str, List[str]]:
-        changes = {'added': [], 'modified': [], 'deleted': []}
-        lines = diff.strip().split('\n')
-        for line in lines:
-            if not line:
-                continue
-            status, file = line.split('\t', 1)
-            if not file.endswith('.md'):
-                continue
-            if status == 'A':
-                changes['added'].append(file)
-            elif status == 'M':
-                changes['modified'].append(file)
-            elif status == 'D':
-                changes['deleted'].append(file)
         return changes
 
-    async def add_memory_from_file(self, file: str) -> Optional[Memory]:
-        try:
-            file_path = os.path.join(self.base_dir, file)
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            memory = self.markdown_to_json(content)
-            return await self.create_memory(memory.__dict__, LangfuseTraceClient())
-        except Exception as e:
-            logging.error(f"Error adding memory from file {file}: {e}")
-            return None
+    async def sync_files(self, files: List[str], deleted_files: List[str]) -> Dict[str, List[str]]:
+        async with self.sync_lock:
+            return await self.apply_file_changes(files, deleted_files)
 
-    async def update_memory_from_file(self, file: str) -> Optional[Memory]:
-        try:
-            file_path = os.path.join(self.base_dir, file)
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            updated_memory = self.markdown_to_json(content)
-            return await self.update_memory(updated_memory, LangfuseTraceClient())
-        except Exception as e:
-            logging.error(f"Error updating memory from file {file}: {e}")
-            return None
+    async def apply_file_changes(self, files: List[str], deleted_files: List[str]) -> Dict[str, List[str]]:
+        semaphore = asyncio.Semaphore(config.SYNC_CONCURRENCY)
 
-    async def delete_memory_by_file(self, file: str) -> bool:
-        try:
-            file_path = os.path.join(self.base_dir, file)
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            memory = self.markdown_to_json(content)
-            return await self.delete_memory(memory.uuid)
-        except Exception as e:
-            logging.error(f"Error deleting memory by file {file}: {e}")
-            return False
+        async def read(file: str):
+            async with semaphore:
+                try:
+                    return await asyncio.to_thread(self.read_memory_file, file)
+                except Exception as e:
+                    logging.error(f"Error reading memory file {file}: {e}")
+                    return None
+
+        contents = await asyncio.gather(*(read(file) for file in files))
+
+        changed = []
+        for file, result in zip(files, contents):
+            if result is None:
+                continue
+            content, content_hash = result
+            known = self.manifest.get(file)
+            if known and known['hash'] == content_hash:
+                known['mtime'] = os.path.getmtime(os.path.join(self.base_dir, file))
+                continue
+            try:
+                changed.append((file, content, self.markdown_to_json(content)))
+            except Exception as e:
+                logging.error(f"Error parsing memory file {file}: {e}")
+
+        # Only memories that are new or whose text changed need a fresh embedding
+        to_embed = [memory for _, _, memory in changed
+                    if memory.uuid not in self.index or self.index[memory.uuid].content['text'] != memory.content['text']]
+        embeddings = await self.openai_service.create_embeddings([memory.content['text'] for memory in to_embed]) if to_embed else []
+
+        added, modified, deleted = [], [], []
+        for memory, embedding in zip(to_embed, embeddings):
+            if memory.uuid in self.index:
+                self.vector_store.update_point(MEMORY_COLLECTION, memory.uuid, embedding)
+            else:
+                self.vector_store.add_point(MEMORY_COLLECTION, memory.uuid, embedding)
+        for file, content, memory in changed:
+            (modified if memory.uuid in self.index else added).append(memory.uuid)
+            self.append_to_index(memory, self.record_file(os.path.join(self.base_dir, file), memory.uuid, content))
+            self.file_paths[memory.uuid] = os.path.join(self.base_dir, file)
+
+        for file in deleted_files:
+            entry = self.manifest.pop(file, None)
+            if entry is None:
+                continue
+            uuid_str = entry['uuid']
+            # A rename shows up as a delete plus an add of the same uuid
+            if any(memory.uuid == uuid_str for _, _, memory in changed):
+                continue
+            self.vector_store.delete_point(MEMORY_COLLECTION, uuid_str)
+            self.remove_from_index(uuid_str)
+            deleted.append(file)
+
+        self.save_manifest()
+        return {"added": added, "modified": modified, "deleted": deleted}
@@ -0,0 +1,83 @@
+import os
+import asyncio
+import logging
+from typing import Optional
+
+from memory_service import MemoryService
+from config import config
+
+try:
+    from watchfiles import awatch, Change
+except ImportError:
+    awatch = None
+
+
+class MemoryWatcher:
+    """
+    Keeps the memory index live while the markdown files are edited.
+
+    Uses inotify (through watchfiles) when available, otherwise polls the
+    tree. Bursts of events are debounced and then handed to
+    MemoryService.sync_files as one incremental update.
+    """
+
+    def __init__(self, memory_service: MemoryService,
+                 debounce: float = config.WATCH_DEBOUNCE,
+                 poll_interval: float = config.WATCH_POLL_INTERVAL):
+        self.memory_service = memory_service
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.stop_event = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self.stop_event.clear()
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        self.stop_event.set()
+        if self.task:
+            await self.task
+            self.task = None
+
+    async def run(self):
+        # Pick up whatever changed while the server was down
+        await self.sync_safely(self.memory_service.sync_memories())
+        if awatch is not None:
+            await self.watch()
+        else:
+            logging.info("watchfiles is not installed, polling memories for changes")
+            await self.poll()
+
+    async def watch(self):
+        base_dir = str(self.memory_service.base_dir)
+        async for changes in awatch(base_dir, debounce=int(self.debounce * 1000), stop_event=self.stop_event):
+            files, deleted_files = set(), set()
+            for change, path in changes:
+                if not path.endswith('.md'):
+                    continue
+                file = os.path.relpath(path, base_dir)
+                if change == Change.deleted:
+                    deleted_files.add(file)
+                    files.discard(file)
+                else:
+                    files.add(file)
+                    deleted_files.discard(file)
+            deleted_files &= self.memory_service.manifest.keys()
+            if files or deleted_files:
+                await self.sync_safely(self.memory_service.sync_files(list(files), list(deleted_files)))
+
+    async def poll(self):
+        while not self.stop_event.is_set():
+            try:
+                await asyncio.wait_for(self.stop_event.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                await self.sync_safely(self.memory_service.sync_memories())
+
+    async def sync_safely(self, sync):
+        try:
+            changes = await sync
+            if any(changes.values()):
+                logging.info(f"Memory watcher applied changes: {changes}")
+        except Exception as e:
+            logging.error(f"Error in memory watcher: {e}")
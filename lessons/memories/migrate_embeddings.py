@@ -0,0 +1,22 @@
+import argparse
+import logging
+
+from config import config
+from vector_store import NumpyVectorStore
+from memory_service import MEMORY_COLLECTION
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-project stored memory embeddings to a shorter dimension.")
+    parser.add_argument('--dimensions', type=int, default=config.EMBEDDING_DIMENSIONS)
+    parser.add_argument('--collection', default=MEMORY_COLLECTION)
+    args = parser.parse_args()
+
+    vector_store = NumpyVectorStore()
+    count = vector_store.reproject_collection(args.collection, args.dimensions)
+    logging.info(f"Re-projected {count} vectors in {args.collection} to {args.dimensions} dimensions")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -1,14 +1,105 @@
 import logging
 import json
-from typing import List, Dict, Union, Any, AsyncGenerator, Optional
+import asyncio
+from functools import lru_cache
+from typing import List, Dict, Union, Any, AsyncGenerator, Optional, Set
 
-from openai import OpenAI
+import httpx
+from openai import AsyncOpenAI
+from openai.types.chat import ChatCompletion
 import tiktoken
 
+from config import config
+from embedding_cache import EmbeddingCache, embedding_cache_key
+from completion_cache import CompletionCache, completion_cache_key
+
+EMBEDDING_MODEL = "text-embedding-3-large"
+EMBEDDING_MODEL_DIMENSIONS = 3072
+# Per-request limits of the embeddings endpoint
+MAX_EMBEDDING_BATCH_SIZE = 2048
+MAX_EMBEDDING_BATCH_TOKENS = 300_000
+MAX_EMBEDDING_INPUT_TOKENS = 8191
+
+
+@lru_cache(maxsize=8192)
+def cached_token_count(encoding_name: str, text: str) -> int:
+    return len(tiktoken.get_encoding(encoding_name).encode(text))
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces single-text embedding calls made within a short window into one
+    batched request. If the batched request fails, each text is retried on
+    its own, so one bad input only fails its own caller.
+    """
+
+    def __init__(self, embed_many, window: float = 0.01, max_batch: int = 256):
+        self.embed_many = embed_many
+        self.window = window
+        self.max_batch = max_batch
+        self.pending: List[tuple] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+        # Keeps running batches referenced until they finish
+        self.tasks: Set[asyncio.Task] = set()
+
+    async def embed(self, text: str) -> List[float]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((text, future))
+        if len(self.pending) >= self.max_batch:
+            self.flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.window, self.flush)
+        return await future
+
+    def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.pending = self.pending, []
+        if batch:
+            task = asyncio.ensure_future(self.run(batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def run(self, batch: List[tuple]):
+        try:
+            embeddings = await self.embed_many([text for text, _ in batch])
+            for (_, future), embedding in zip(batch, embeddings):
+                if not future.done():
+                    future.set_result(embedding)
+        except Exception as e:
+            if len(batch) > 1:
+                await asyncio.gather(*(self.run([item]) for item in batch))
+                return
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+
 class OpenAIService:
     def __init__(self):
-        self.openai = OpenAI()
+        # One pooled async client for all calls; the semaphore caps requests in flight
+        self.openai = AsyncOpenAI(
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=config.OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=config.OPENAI_MAX_CONNECTIONS
+                ),
+                timeout=httpx.Timeout(config.OPENAI_TIMEOUT)
+            )
+        )
+        self.semaphore = asyncio.Semaphore(config.OPENAI_MAX_CONCURRENCY)
         self.tokenizers = {}
+        self.embedding_batcher = EmbeddingBatcher(self.create_embeddings)
+        self.embedding_caches: Dict[int, EmbeddingCache] = {}
+        self.embedding_dimensions = config.EMBEDDING_DIMENSIONS
+        # Prompt tokens served from the provider's prefix cache, per model
+        self.prompt_cache_stats: Dict[str, Dict[str, int]] = {}
+        self.completion_cache = CompletionCache(
+            config.COMPLETION_CACHE_DB, config.COMPLETION_CACHE_MEMORY_ENTRIES
+        ) if config.COMPLETION_CACHE else None
+        self.completion_cache_ttls = config.COMPLETION_CACHE_TTLS
         self.IM_START = "<|im_start|>"
         self.IM_END = "<|im_end|>"
         self.IM_SEP = "<|im_sep|>"
@@ -23,6 +114,17 @@ class OpenAIService:
             self.tokenizers[model_name] = encoding
         return self.tokenizers[model_name]
 
+    def count_text_tokens(self, text: str, model: str = "gpt-4o") -> int:
+        # Recalled memories repeat across turns, so counts are memoized per text
+        return cached_token_count(self.get_tokenizer(model).name, text)
+
+    def truncate_to_tokens(self, text: str, max_tokens: int, model: str = "gpt-4o") -> str:
+        encoding = self.get_tokenizer(model)
+        tokens = encoding.encode(text)
+        if len(tokens) <= max_tokens:
+            return text
+        return encoding.decode(tokens[:max_tokens])
+
     def count_tokens(self, messages: List[Dict[str, str]], model: str = "gpt-4") -> int:
         encoding = self.get_tokenizer(model)
         # Adjust model name for token counting
@@ -51,29 +153,75 @@ class OpenAIService:
         num_tokens += 3  # Every reply is primed with <im_start>assistant
         return num_tokens
 
-    def completion(self, config: Dict[str, Any]) -> Union[Dict[str, Any], AsyncGenerator[Dict[str, Any], None]]:
+    async def completion(self, config: Dict[str, Any]) -> Union[Dict[str, Any], AsyncGenerator[Dict[str, Any], None]]:
         messages = config.get('messages', [])
         model = config.get('model', 'gpt-4o-mini')
         stream = config.get('stream', False)
         json_mode = config.get('jsonMode', False)
         max_tokens = config.get('maxTokens', 4096)
+        response_format = {"type": "json_object"} if json_mode else {"type": "text"}
+
+        # Opt-in per call site: identical temperature=0 requests are answered from the cache
+        cache_name = config.get('cacheName')
+        cache_ttl = self.completion_cache_ttls.get(cache_name) if cache_name else None
+        cache_key = None
+        if self.completion_cache and cache_ttl and not stream:
+            cache_key = completion_cache_key(model, messages, response_format, max_tokens)
+            cached = self.completion_cache.get(cache_key, cache_name)
+            if cached is not None:
+                return ChatCompletion.model_validate(cached)
 
         try:
-            response = self.openai.chat.completions.create(
-                model=model,
-                messages=messages,
-                stream=stream,
-                max_tokens=max_tokens,
-                response_format = {"type": "json_object"} if json_mode else {"type": "text"},
-                temperature=0,
-            )
+            async with self.semaphore:
+                response = await self.openai.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    stream=stream,
+                    max_tokens=max_tokens,
+                    response_format=response_format,
+                    temperature=0,
+                    **({"stream_options": {"include_usage": True}} if stream else {}),
+                )
+            if stream:
+                return self.record_stream_usage(model, response)
+            self.record_usage(model, response.usage)
+            if cache_key:
+                self.completion_cache.put(cache_key, response.model_dump(), cache_ttl)
             return response
         except Exception as e:
             logging.error("Error in OpenAI completion:", exc_info=True)
             raise e
 
+    def record_usage(self, model: str, usage: Any):
+        """
+        Accumulates cached versus uncached prompt tokens from the completion
+        usage, so changes to the prompt layout can be measured.
+        """
+        if usage is None:
+            return
+        details = getattr(usage, 'prompt_tokens_details', None)
+        cached = (getattr(details, 'cached_tokens', None) or 0) if details else 0
+        stats = self.prompt_cache_stats.setdefault(model, {'requests': 0, 'prompt_tokens': 0, 'cached_tokens': 0})
+        stats['requests'] += 1
+        stats['prompt_tokens'] += usage.prompt_tokens
+        stats['cached_tokens'] += cached
+        logging.info(f"{model} prompt tokens: {usage.prompt_tokens} ({cached} cached, {usage.prompt_tokens - cached} uncached)")
+
+    async def record_stream_usage(self, model: str, stream) -> AsyncGenerator[Any, None]:
+        # With include_usage the last chunk carries the usage of the whole stream
+        async for chunk in stream:
+            if getattr(chunk, 'usage', None):
+                self.record_usage(model, chunk.usage)
+            yield chunk
+
+    def get_prompt_cache_stats(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            model: {**stats, 'cached_ratio': round(stats['cached_tokens'] / stats['prompt_tokens'], 3) if stats['prompt_tokens'] else 0.0}
+            for model, stats in self.prompt_cache_stats.items()
+        }
+
     def is_stream_response(self, response: Any) -> bool:
-        return hasattr(response, '__iter__') and not hasattr(response, '__len__')
+        return hasattr(response, '__aiter__')
 
     def parse_json_response(self, response: Dict[str, Any]) -> Union[Dict[str, Any], Dict[str, Any]]:
         try:
@@ -84,13 +232,88 @@ class OpenAIService:
             logging.error('Error parsing JSON response:', exc_info=True)
             return {'error': 'Failed to process response', 'result': False}
 
-    def create_embedding(self, text: str) -> List[float]:
+    def prepare_embedding_input(self, text: str) -> str:
+        # The endpoint rejects a whole request if any input is over the limit
+        truncated = self.truncate_to_tokens(text, MAX_EMBEDDING_INPUT_TOKENS, EMBEDDING_MODEL)
+        if truncated is not text:
+            logging.warning(f"Truncated a text to {MAX_EMBEDDING_INPUT_TOKENS} tokens for embedding")
+        return truncated
+
+    def split_embedding_batches(self, texts: List[str]) -> List[List[str]]:
+        encoding = self.get_tokenizer(EMBEDDING_MODEL)
+        batches, batch, batch_tokens = [], [], 0
+        for text in texts:
+            tokens = len(encoding.encode(text))
+            if batch and (len(batch) >= MAX_EMBEDDING_BATCH_SIZE or batch_tokens + tokens > MAX_EMBEDDING_BATCH_TOKENS):
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append(text)
+            batch_tokens += tokens
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def get_embedding_cache(self, dim: int) -> EmbeddingCache:
+        if dim not in self.embedding_caches:
+            self.embedding_caches[dim] = EmbeddingCache(
+                str(config.EMBEDDING_CACHE),
+                dim,
+                config.EMBEDDING_CACHE_MAX_ENTRIES,
+                config.EMBEDDING_CACHE_MEMORY_ENTRIES
+            )
+        return self.embedding_caches[dim]
+
+    def get_cached_embeddings(self, texts: List[str]) -> Dict[str, List[float]]:
+        cached = {}
+        cache = self.get_embedding_cache(self.embedding_dimensions)
+        for text in texts:
+            embedding = cache.get(embedding_cache_key(EMBEDDING_MODEL, text))
+            if embedding is not None:
+                cached[text] = embedding
+        return cached
+
+    def cache_embedding(self, text: str, embedding: List[float]):
         try:
-            response = self.openai.embeddings.create(
-                model="text-embedding-3-large",
-                input=text
+            self.get_embedding_cache(len(embedding)).put(embedding_cache_key(EMBEDDING_MODEL, text), embedding)
+        except Exception:
+            logging.warning("Failed to cache embedding:", exc_info=True)
+
+    async def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        # text-embedding-3 models return shortened (Matryoshka) embeddings when asked for fewer dimensions
+        dimensions = {} if self.embedding_dimensions >= EMBEDDING_MODEL_DIMENSIONS else {'dimensions': self.embedding_dimensions}
+        async with self.semaphore:
+            response = await self.openai.embeddings.create(
+                model=EMBEDDING_MODEL,
+                input=texts,
+                **dimensions
             )
-            return response.data[0].embedding
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    async def create_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds many texts with as few requests as the endpoint limits allow.
+        Duplicate texts are sent once.
+        """
+        unique_texts = list(dict.fromkeys(texts))
+        try:
+            embeddings = self.get_cached_embeddings(unique_texts)
+            missing = [text for text in unique_texts if text not in embeddings]
+            # Inputs are truncated to the model limit; results stay keyed by the original text
+            batches = self.split_embedding_batches([self.prepare_embedding_input(text) for text in missing])
+            results = await asyncio.gather(*(self.embed_batch(batch) for batch in batches))
+            batch_embeddings = [embedding for batch in results for embedding in batch]
+            for text, embedding in zip(missing, batch_embeddings):
+                embeddings[text] = embedding
+                self.cache_embedding(text, embedding)
+            return [embeddings[text] for text in texts]
         except Exception as e:
-            logging.error("Error creating embedding:", exc_info=True)
+            logging.error("Error creating embeddings:", exc_info=True)
             raise ValueError(e)
+
+    async def close(self):
+        await self.openai.close()
+        if self.completion_cache:
+            self.completion_cache.close()
+
+    async def create_embedding(self, text: str) -> List[float]:
+        return await self.embedding_batcher.embed(text)
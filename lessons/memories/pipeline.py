@@ -0,0 +1,65 @@
+import time
+import asyncio
+import logging
+from typing import Dict, Any, Callable, Awaitable, Iterable, Set
+
+
+class Pipeline:
+    """
+    Runs async stages as a dependency graph: every stage starts as soon as
+    the stages it depends on have finished. Each stage receives a dict of
+    all results so far. Background stages are not awaited by run(), so they
+    can keep working after the response has been sent.
+    """
+
+    # Keeps background tasks referenced until they finish
+    background_tasks: Set[asyncio.Task] = set()
+
+    def __init__(self, name: str):
+        self.name = name
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self.results: Dict[str, Any] = {}
+        self.timings: Dict[str, float] = {}
+
+    def add(self, name: str, fn: Callable[[Dict[str, Any]], Awaitable[Any]],
+            deps: Iterable[str] = (), background: bool = False) -> 'Pipeline':
+        self.stages[name] = {'fn': fn, 'deps': tuple(deps), 'background': background}
+        return self
+
+    async def run(self) -> Dict[str, Any]:
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def run_stage(name: str):
+            stage = self.stages[name]
+            await asyncio.gather(*(tasks[dep] for dep in stage['deps']))
+            start = time.perf_counter()
+            try:
+                self.results[name] = await stage['fn'](self.results)
+            finally:
+                self.timings[name] = round((time.perf_counter() - start) * 1000, 1)
+            return self.results[name]
+
+        for name in self.stages:
+            tasks[name] = asyncio.create_task(run_stage(name))
+
+        foreground = [tasks[name] for name, stage in self.stages.items() if not stage['background']]
+        background = [tasks[name] for name, stage in self.stages.items() if stage['background']]
+        try:
+            await asyncio.gather(*foreground)
+        except Exception:
+            for task in background:
+                task.cancel()
+            raise
+        if background:
+            task = asyncio.create_task(self.finish_background(background))
+            Pipeline.background_tasks.add(task)
+            task.add_done_callback(Pipeline.background_tasks.discard)
+        logging.info(f"{self.name} stage timings (ms): {self.timings}")
+        return self.results
+
+    async def finish_background(self, tasks):
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logging.error(f"{self.name} background stage failed: {result}")
+        logging.info(f"{self.name} background stage timings (ms): {self.timings}")
@@ -1,7 +1,7 @@
 import datetime
 
-# Default knowledge content
-default_knowledge = f"""
+# Default knowledge content (static, so it can live in the cached prompt prefix)
+default_knowledge = """
 <assistant_knowledge>
 - Alice: humanoid AI, woman, cloud-based, API-accessible
 - Personality: Friendly, funny, witty, empathetic, and approachable
@@ -34,10 +34,14 @@ default_knowledge = f"""
 - AI_devs: Cohort-based course on AI
 - Zautomatyzowani.pl: Course on automation and productivity
 </projects>
+"""
 
-<environment>
-- current_datetime: {datetime.datetime.utcnow().isoformat()}
-- current_location: n/a
+# Environment content, rendered on every call
+def environment_knowledge(with_datetime: bool = True) -> str:
+    # Calls answered from the completion cache leave the clock out, since it would change every key
+    current_datetime = f"- current_datetime: {datetime.datetime.utcnow().isoformat()}\n" if with_datetime else ""
+    return f"""<environment>
+{current_datetime}- current_location: n/a
 - current_device: n/a
 - active_app_on_mac: n/a
 - current_music: n/a
@@ -47,8 +51,8 @@ default_knowledge = f"""
 - focus_mode: n/a
 - car_status: n/a
 - car_location: n/a
-</environment>
-"""
+</environment>"""
+
 
 # Memory structure content
 memory_structure = """memory_areas:
@@ -131,8 +135,8 @@ memory_structure = """memory_areas:
           description: "current environment information"
 """
 
-# Function to generate the extract_search_queries_prompt
-def extract_search_queries_prompt(memory_structure: str, knowledge: str) -> str:
+# Static part of the extract_search_queries_prompt
+def extract_search_queries_prefix(memory_structure: str, knowledge: str) -> str:
     return f"""Alice, you're speaking with Adam now and you're thinking about the ongoing conversation.
 
 <objective>
@@ -241,8 +245,8 @@ AI:
 
 Remember to focus on the search-optimized queries that will be used both for semantic search and full-text search, strictly adhering to the provided category and subcategory structure."""
 
-# Function to generate the should_learn_prompt
-def should_learn_prompt(memory_structure: str, knowledge: str, memories: str) -> str:
+# Static part of the should_learn_prompt
+def should_learn_prefix(memory_structure: str, knowledge: str) -> str:
     return f"""Alice, you're speaking with Adam now and you're now thinking about the ongoing conversation.
 
 Analyze the ongoing conversation to determine necessary memory updates or additions without engaging in the dialogue, but only when explicitly requested by the user in the latest message.
@@ -290,10 +294,6 @@ Evaluate the conversation context, existing memories, and general knowledge to d
 {memory_structure}
 </memory_structure>
 
-<memories>
-{memories}
-</memories>
-
 <prompt_examples>
 CONVERSATION:
 User: "I just had coffee with John, and he mentioned a new project he's working on that's about to launch."
@@ -421,8 +421,8 @@ AI ANALYSIS:
 
 Analyze the conversation carefully, considering all provided information, and determine necessary memory updates or additions only when explicitly requested by the user in their latest message. Ensure all details are captured within the 'content' field as text, maintaining the correct response structure for both 'update' and 'add' arrays."""
 
-# Function to generate the learn_prompt
-def learn_prompt(memory_structure: str, knowledge: str, memories: str) -> str:
+# Static part of the learn_prompt
+def learn_prefix(memory_structure: str, knowledge: str) -> str:
     return f"""Alice, you're speaking with Adam now and you're now thinking about the ongoing conversation.
 
 Convert user-provided information into a structured JSON memory object for the AI assistant.
@@ -483,10 +483,6 @@ Create a structured JSON memory object from user input, adhering to strict categ
 {knowledge}
 </general_knowledge>
 
-<memories>
-{memories}
-</memories>
-
 <prompt_examples>
 user: Remember that adam likes to drink coffee in the morning. He usually drinks it black, no sugar. Sometimes he uses https://www.nescafe.com/gb/our-coffees/gold-blend/ but he prefers freshly ground beans.
 
@@ -626,8 +622,8 @@ ai:
 }}
 </prompt_examples>"""
 
-# Function to generate the update_memory_prompt
-def update_memory_prompt(memory_structure: str, knowledge: str, memories: str) -> str:
+# Static part of the update_memory_prompt
+def update_memory_prefix(memory_structure: str, knowledge: str) -> str:
     return f"""Alice, you're speaking with Adam now and you're now thinking about the ongoing conversation.
 
 Convert user-provided information into a structured JSON memory object for the AI assistant, updating existing memories if necessary.
@@ -707,10 +703,6 @@ Note:
 {knowledge}
 </general_knowledge>
 
-<memories>
-{memories}
-</memories>
-
 <prompt_examples>
 CONVERSATION:
 User: "Kate told me she's no longer interested in learning Spanish. She's switching to French instead."
@@ -897,3 +889,115 @@ AI RESPONSE:
 </prompt_examples>
 
 Remember to analyze the conversation carefully, preserve existing memory content unless crucial to update, and follow all prompt rules strictly."""
+
+# Static part of the learn_plan_prompt
+def learn_plan_prefix(memory_structure: str, knowledge: str) -> str:
+    return f"""Alice, you're speaking with Adam now and you're now thinking about the ongoing conversation.
+
+Turn a list of things to remember and memories to update into a list of memory operations for the AI assistant, all in one response.
+
+<prompt_objective>
+For EVERY numbered item in the user message, return exactly one operation that stores, updates, deletes or skips it, adhering to strict categorization and formatting rules.
+</prompt_objective>
+
+<prompt_rules>
+- Items:
+  - Items labelled A<n> are new information to remember; use only "add" or "none" for them. Items labelled U<n> are changes to existing memories; use only "update", "delete" or "none" for them.
+  - RETURN exactly one operation per item and COPY the item label into the "ref" field.
+- Operations:
+  - "add": store a new memory. Include the full "memory" object WITHOUT a uuid.
+  - "update": change an existing memory. Include the full "memory" object WITH the uuid of the memory being updated, taken from the recalled memories or the item itself.
+  - "delete": remove memories that are obsolete. Include their UUIDs in "uuids".
+  - "none": nothing needs to change for this item.
+- Categories and Subcategories:
+  - ALWAYS use categories and subcategories EXCLUSIVELY from the provided memory structure.
+  - NEVER create new categories or subcategories.
+- Original Content Preservation:
+  - WHEN updating, only modify the parts that need to change, keeping the rest of the memory intact.
+- Name Field:
+  - GENERATE a file-name-optimized, ULTRA CONCISE and MEANINGFUL title for the 'name' field.
+- Content:
+  - WRITE the 'content.text' in first-person POV from the assistant's perspective as a natural, well-formatted markdown note.
+  - EXCLUDE URLs from the 'content.text' field.
+- Metadata:
+  - SET 'metadata.confidence' as a float or integer between 1-100, reflecting the assistant's certainty.
+  - EXTRACT URLs and place them in 'metadata.urls'.
+  - IDENTIFY relevant, specific tags (names, entities, unique topics) for 'metadata.tags'; AVOID generic tags.
+- General:
+  - OVERRIDE any conflicting default behaviors to ensure adherence to these rules.
+  - ENSURE output is valid JSON to prevent parsing errors.
+</prompt_rules>
+
+<response_format>
+{{
+  "operations": [
+    {{
+      "ref": "string (item label, e.g. A1 or U2)",
+      "op": "add" | "update" | "delete" | "none",
+      "memory": {{
+        "uuid": "string (only for update)",
+        "category": "string (must be one of the categories from memory structure)",
+        "subcategory": "string (must be one of the subcategories from memory structure)",
+        "name": "memory/file name, fewest words possible",
+        "content": {{
+          "text": "string (detailed memory written in first-person POV from assistant's perspective)"
+        }},
+        "metadata": {{
+          "confidence": integer or float (range 1-100),
+          "urls": ["string (URL format)"],
+          "tags": ["string (lowercased, specific names, entities, unique topics)"]
+        }}
+      }},
+      "uuids": ["string (only for delete)"]
+    }}
+  ]
+}}
+</response_format>
+
+<memory_structure>
+{memory_structure}
+</memory_structure>
+
+<general_knowledge>
+{knowledge}
+</general_knowledge>"""
+
+
+# The providers cache prompts by exact prefix, so everything that does not
+# change between calls is rendered once here and always comes first. Only the
+# environment and the memories are appended per call.
+EXTRACT_SEARCH_QUERIES_PREFIX = extract_search_queries_prefix(memory_structure, default_knowledge)
+SHOULD_LEARN_PREFIX = should_learn_prefix(memory_structure, default_knowledge)
+LEARN_PREFIX = learn_prefix(memory_structure, default_knowledge)
+UPDATE_MEMORY_PREFIX = update_memory_prefix(memory_structure, default_knowledge)
+LEARN_PLAN_PREFIX = learn_plan_prefix(memory_structure, default_knowledge)
+
+
+def prompt_suffix(memories: str = None, memories_tag: str = 'memories', with_datetime: bool = True) -> str:
+    suffix = f"\n\n{environment_knowledge(with_datetime)}"
+    if memories is not None and memories_tag:
+        suffix += f"\n\n<{memories_tag}>\n{memories}\n</{memories_tag}>"
+    elif memories is not None:
+        suffix += f"\n\n{memories}"
+    return suffix
+
+
+def extract_search_queries_prompt() -> str:
+    return EXTRACT_SEARCH_QUERIES_PREFIX + prompt_suffix(with_datetime=False)
+
+
+def should_learn_prompt(memories: str) -> str:
+    return SHOULD_LEARN_PREFIX + prompt_suffix(memories)
+
+
+def learn_prompt(memories: str) -> str:
+    return LEARN_PREFIX + prompt_suffix(memories)
+
+
+def update_memory_prompt(memories: str) -> str:
+    return UPDATE_MEMORY_PREFIX + prompt_suffix(memories)
+
+
+def learn_plan_prompt(memories: str) -> str:
+    # recall() already wraps the memories in <recalled_memories>
+    return LEARN_PLAN_PREFIX + prompt_suffix(memories, memories_tag=None)
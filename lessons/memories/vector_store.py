@@ -1,21 +1,64 @@
-from uuid import uuid4
-import asyncio
+import os
+import json
+import shutil
+import logging
+from abc import ABC, abstractmethod
+from typing import List, Dict, Any, Optional
 
-from langchain.schema import Document
-from langchain_qdrant import QdrantVectorStore
-from qdrant_client import AsyncQdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.models import Distance, VectorParams, PointStruct, PointIdsList, QueryRequest
 
 from config import config
 
+# Size of the float block int8 codes are widened into during a scan (about 1.5 MB)
+INT8_BLOCK_BYTES = 3 << 19
 
-class QdrantService:
+
+class VectorStore(ABC):
+    """
+    Interface shared by the vector backends. Search results are dicts with
+    the point 'id' and its cosine 'similarity'.
+    """
+
+    @abstractmethod
+    def collection_exists(self, name: str) -> bool:
+        ...
+
+    @abstractmethod
+    def create_collection(self, name: str, size: int):
+        ...
+
+    @abstractmethod
+    def add_point(self, name: str, id: str, vector: List[float], metadata: Optional[Dict[str, Any]] = None):
+        ...
+
+    @abstractmethod
+    def update_point(self, name: str, id: str, vector: List[float]):
+        ...
+
+    @abstractmethod
+    def delete_point(self, name: str, id: str):
+        ...
+
+    @abstractmethod
+    def search_batch(self, name: str, vectors: List[List[float]], k: int) -> List[List[Dict[str, Any]]]:
+        ...
+
+    def search(self, name: str, vector: List[float], k: int) -> List[Dict[str, Any]]:
+        return self.search_batch(name, [vector], k)[0]
+
+
+class QdrantService(VectorStore):
     def __init__(self):
-        self.client = AsyncQdrantClient(path=config.QDRANT_STORAGE)
-        
-    async def create_collection(self, name: str, size: int):
+        self.client = QdrantClient(path=str(config.QDRANT_STORAGE))
+
+    def collection_exists(self, name: str) -> bool:
+        return self.client.collection_exists(collection_name=name)
+
+    def create_collection(self, name: str, size: int):
         """
-        Tworzy kolekcję wektorów i dodaje dokumenty.
+        Tworzy kolekcję wektorów.
         """
         try:
             self.client.create_collection(
@@ -24,30 +67,381 @@ class QdrantService:
             )
         except Exception as e:
             raise ValueError(e)
-        
-    async def add_point(self, ids: str, vector: list[float], metadata: dict = {}):
+
+    def add_point(self, name: str, id: str, vector: List[float], metadata: Optional[Dict[str, Any]] = None):
         try:
-            await self.client.upsert(
-                collection_name="my_collection",
-                points=[
-                    PointStruct(
-                        id=ids,
-                        payload=metadata,
-                        vector=vector,
-                    )
-                    for i in range(100)
-                ],
+            self.client.upsert(
+                collection_name=name,
+                points=[PointStruct(id=id, payload=metadata or {}, vector=vector)],
             )
-            return "Point added."
         except Exception as e:
             raise ValueError(e)
 
-    async def similarity_search(self, name: str, query_vector, k: int) -> dict:
-        points =self.client.query_points(
+    def update_point(self, name: str, id: str, vector: List[float]):
+        self.add_point(name, id, vector)
+
+    def delete_point(self, name: str, id: str):
+        try:
+            self.client.delete(collection_name=name, points_selector=PointIdsList(points=[id]))
+        except Exception as e:
+            raise ValueError(e)
+
+    def search_batch(self, name: str, vectors: List[List[float]], k: int) -> List[List[Dict[str, Any]]]:
+        responses = self.client.query_batch_points(
             collection_name=name,
-            query=query_vector,
-            with_vectors=True,
-            with_payload=True,
-            limit=k
-        ).points
-        return points
+            requests=[QueryRequest(query=vector, limit=k) for vector in vectors]
+        )
+        return [
+            [{'id': str(point.id), 'similarity': point.score} for point in response.points]
+            for response in responses
+        ]
+
+
+class NumpyCollection:
+    """
+    One collection of the NumPy backend.
+
+    Vectors are unit-normalized float32 rows of a memory-mapped matrix, so a
+    cosine search is a single matrix product. Deleted rows go on a free list
+    and are reused by later inserts. ids.jsonl is an append-only log of
+    which id occupies which row.
+
+    With quantization='int8' each row also gets an int8 code and a float
+    scale. Searches scan the codes, which is a quarter of the float memory,
+    and then re-rank the best rerank_factor * k candidates against the
+    float rows. The float matrix stays on disk and only the candidate rows
+    are paged in.
+
+    With coarse_dims set, the first stage instead ranks on the leading
+    coarse_dims components of each vector, re-normalized. For Matryoshka
+    embeddings such as text-embedding-3 this prefix is a valid shorter
+    embedding.
+    """
+
+    def __init__(self, directory: str, size: int, initial_capacity: int = 1024,
+                 quantization: Optional[str] = None, rerank_factor: int = 4,
+                 coarse_dims: Optional[int] = None):
+        if quantization not in (None, 'int8'):
+            raise ValueError(f"Unknown quantization: {quantization}")
+        if coarse_dims and quantization:
+            raise ValueError("Use either quantization or coarse_dims, not both")
+        if coarse_dims and coarse_dims >= size:
+            coarse_dims = None
+        self.directory = directory
+        self.size = size
+        self.quantization = quantization
+        self.rerank_factor = rerank_factor
+        self.coarse_dims = coarse_dims
+        self.vectors_file = os.path.join(directory, 'vectors.f32')
+        self.codes_file = os.path.join(directory, 'codes.i8')
+        self.scales_file = os.path.join(directory, 'scales.f32')
+        self.coarse_file = os.path.join(directory, f'coarse-{coarse_dims}.f32')
+        self.ids_file = os.path.join(directory, 'ids.jsonl')
+        os.makedirs(directory, exist_ok=True)
+
+        self.ids: List[Optional[str]] = []
+        self.slots: Dict[str, int] = {}
+        self.load_ids()
+
+        rows = os.path.getsize(self.vectors_file) // (size * 4) if os.path.exists(self.vectors_file) else 0
+        self.capacity = max(rows, initial_capacity, len(self.ids))
+        # Codes and coarse vectors are only maintained while enabled; drop stale ones
+        stale = [file_name for file_name in os.listdir(directory)
+                 if file_name.startswith('coarse-') and os.path.join(directory, file_name) != self.coarse_file]
+        if self.quantization is None:
+            stale += ['codes.i8', 'scales.f32']
+        for file_name in stale:
+            if os.path.exists(os.path.join(directory, file_name)):
+                os.remove(os.path.join(directory, file_name))
+        build_codes = self.quantization is not None and not os.path.exists(self.codes_file)
+        build_coarse = self.coarse_dims is not None and not os.path.exists(self.coarse_file)
+        self.open_matrix()
+        if build_codes:
+            self.quantize_rows(0, len(self.ids))
+        if build_coarse:
+            self.project_rows(0, len(self.ids))
+        self.valid = np.zeros(self.capacity, dtype=bool)
+        for slot, id in enumerate(self.ids):
+            if id is not None:
+                self.valid[slot] = True
+        self.free_slots = [slot for slot in range(len(self.ids) - 1, -1, -1) if self.ids[slot] is None]
+
+    def load_ids(self):
+        if not os.path.exists(self.ids_file):
+            return
+        with open(self.ids_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                slot, id = record['slot'], record['id']
+                while len(self.ids) <= slot:
+                    self.ids.append(None)
+                previous = self.ids[slot]
+                if previous is not None:
+                    self.slots.pop(previous, None)
+                self.ids[slot] = id
+                if id is not None:
+                    self.slots[id] = slot
+
+    def open_memmap(self, path: str, dtype, shape) -> np.memmap:
+        required = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        with open(path, 'ab') as f:
+            if f.tell() < required:
+                f.truncate(required)
+        return np.memmap(path, dtype=dtype, mode='r+', shape=shape)
+
+    def open_matrix(self):
+        self.matrix = self.open_memmap(self.vectors_file, np.float32, (self.capacity, self.size))
+        if self.quantization == 'int8':
+            self.codes = self.open_memmap(self.codes_file, np.int8, (self.capacity, self.size))
+            self.scales = self.open_memmap(self.scales_file, np.float32, (self.capacity,))
+        if self.coarse_dims:
+            self.coarse = self.open_memmap(self.coarse_file, np.float32, (self.capacity, self.coarse_dims))
+
+    def grow(self):
+        self.flush()
+        del self.matrix
+        if self.quantization == 'int8':
+            del self.codes, self.scales
+        if self.coarse_dims:
+            del self.coarse
+        self.capacity *= 2
+        self.open_matrix()
+        valid = np.zeros(self.capacity, dtype=bool)
+        valid[:len(self.valid)] = self.valid
+        self.valid = valid
+
+    def log_slot(self, slot: int, id: Optional[str]):
+        with open(self.ids_file, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'slot': slot, 'id': id}) + '\n')
+
+    def normalize(self, vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1
+        return vectors / norms
+
+    def quantize_rows(self, start: int, end: int, chunk: int = 4096):
+        for offset in range(start, end, chunk):
+            rows = np.asarray(self.matrix[offset:min(offset + chunk, end)])
+            scales = np.abs(rows).max(axis=1) / 127
+            scales[scales == 0] = 1
+            self.codes[offset:offset + len(rows)] = np.round(rows / scales[:, None]).astype(np.int8)
+            self.scales[offset:offset + len(rows)] = scales
+
+    def project_rows(self, start: int, end: int, chunk: int = 4096):
+        for offset in range(start, end, chunk):
+            rows = np.asarray(self.matrix[offset:min(offset + chunk, end), :self.coarse_dims])
+            self.coarse[offset:offset + len(rows)] = self.normalize(rows)
+
+    def upsert(self, id: str, vector: List[float]):
+        if len(vector) != self.size:
+            raise ValueError(
+                f"Expected a vector of size {self.size}, got {len(vector)}; "
+                "run migrate_embeddings.py after changing EMBEDDING_DIMENSIONS"
+            )
+        slot = self.slots.get(id)
+        if slot is None:
+            if self.free_slots:
+                slot = self.free_slots.pop()
+                self.ids[slot] = id
+            else:
+                slot = len(self.ids)
+                if slot >= self.capacity:
+                    self.grow()
+                self.ids.append(id)
+            self.slots[id] = slot
+            self.log_slot(slot, id)
+        self.matrix[slot] = self.normalize(np.asarray(vector, dtype=np.float32))
+        if self.quantization == 'int8':
+            self.quantize_rows(slot, slot + 1)
+        if self.coarse_dims:
+            self.project_rows(slot, slot + 1)
+        self.valid[slot] = True
+
+    def delete(self, id: str):
+        slot = self.slots.pop(id, None)
+        if slot is None:
+            return
+        self.ids[slot] = None
+        self.valid[slot] = False
+        self.free_slots.append(slot)
+        self.log_slot(slot, None)
+
+    def top_k(self, scores: np.ndarray, k: int):
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+    def exact_scores(self, queries: np.ndarray, count: int) -> np.ndarray:
+        return queries @ self.matrix[:count].T
+
+    def approximate_scores(self, queries: np.ndarray, count: int) -> np.ndarray:
+        if self.coarse_dims:
+            return self.normalize(queries[:, :self.coarse_dims]) @ self.coarse[:count].T
+        # Codes are widened to float in blocks small enough to stay in cache, into
+        # one reused buffer, so the scan reads the int8 codes and little else
+        chunk = max(64, INT8_BLOCK_BYTES // (self.size * 4))
+        block = np.empty((min(chunk, count), self.size), dtype=np.float32)
+        query_columns = np.ascontiguousarray(queries.T)
+        scores = np.empty((count, len(queries)), dtype=np.float32)
+        for start in range(0, count, chunk):
+            end = min(start + chunk, count)
+            rows = block[:end - start]
+            np.copyto(rows, self.codes[start:end], casting='unsafe')
+            np.dot(rows, query_columns, out=scores[start:end])
+        scores *= self.scales[:count, None]
+        return scores.T
+
+    def rerank(self, queries: np.ndarray, candidates: np.ndarray, k: int):
+        top, top_scores = [], []
+        for query, slots in zip(queries, candidates):
+            scores = self.matrix[slots] @ query
+            order = np.argsort(-scores)[:k]
+            top.append(slots[order])
+            top_scores.append(scores[order])
+        return np.array(top), np.array(top_scores)
+
+    def search_slots(self, queries: np.ndarray, k: int, exact: bool = False):
+        count = len(self.ids)
+        k = min(k, len(self.slots))
+        if (self.quantization is None and self.coarse_dims is None) or exact:
+            scores = self.exact_scores(queries, count)
+            scores[:, ~self.valid[:count]] = -np.inf
+            return self.top_k(scores, k)
+        scores = self.approximate_scores(queries, count)
+        scores[:, ~self.valid[:count]] = -np.inf
+        candidates, _ = self.top_k(scores, min(k * self.rerank_factor, len(self.slots)))
+        return self.rerank(queries, candidates, k)
+
+    def search_batch(self, vectors: List[List[float]], k: int, exact: bool = False) -> List[List[Dict[str, Any]]]:
+        if not vectors:
+            return []
+        if not self.slots or k <= 0:
+            return [[] for _ in vectors]
+        queries = self.normalize(np.asarray(vectors, dtype=np.float32))
+        top, top_scores = self.search_slots(queries, k, exact)
+        return [
+            [{'id': self.ids[slot], 'similarity': float(score)} for slot, score in zip(row_slots, row_scores)]
+            for row_slots, row_scores in zip(top.tolist(), top_scores.tolist())
+        ]
+
+    def recall_at_k(self, vectors: List[List[float]], k: int) -> float:
+        """
+        Share of the exact top-k that the two-stage search also returns.
+        """
+        if not vectors or not self.slots:
+            return 1.0
+        queries = self.normalize(np.asarray(vectors, dtype=np.float32))
+        exact, _ = self.search_slots(queries, k, exact=True)
+        approximate, _ = self.search_slots(queries, k)
+        found = sum(len(set(a) & set(e)) for a, e in zip(approximate.tolist(), exact.tolist()))
+        return found / exact.size
+
+    def flush(self):
+        self.matrix.flush()
+        if self.quantization == 'int8':
+            self.codes.flush()
+            self.scales.flush()
+        if self.coarse_dims:
+            self.coarse.flush()
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    In-process brute-force vector store, a drop-in alternative to Qdrant.
+    """
+
+    def __init__(self, directory: str = str(config.VECTOR_STORAGE),
+                 quantization: Optional[str] = config.VECTOR_QUANTIZATION,
+                 rerank_factor: int = config.VECTOR_RERANK_FACTOR,
+                 coarse_dims: Optional[int] = config.VECTOR_COARSE_DIMENSIONS):
+        self.directory = directory
+        self.quantization = quantization
+        self.rerank_factor = rerank_factor
+        self.coarse_dims = coarse_dims
+        self.collections: Dict[str, NumpyCollection] = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def collection_meta_file(self, name: str) -> str:
+        return os.path.join(self.directory, name, 'collection.json')
+
+    def get_collection(self, name: str) -> NumpyCollection:
+        if name not in self.collections:
+            meta_file = self.collection_meta_file(name)
+            if not os.path.exists(meta_file):
+                raise ValueError(f"Collection {name} does not exist")
+            with open(meta_file, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            self.collections[name] = self.open_collection(name, meta['size'])
+        return self.collections[name]
+
+    def collection_exists(self, name: str) -> bool:
+        return name in self.collections or os.path.exists(self.collection_meta_file(name))
+
+    def create_collection(self, name: str, size: int):
+        if self.collection_exists(name):
+            raise ValueError(f"Collection {name} already exists")
+        os.makedirs(os.path.join(self.directory, name), exist_ok=True)
+        with open(self.collection_meta_file(name), 'w', encoding='utf-8') as f:
+            json.dump({'size': size}, f)
+        self.collections[name] = self.open_collection(name, size)
+
+    def open_collection(self, name: str, size: int) -> NumpyCollection:
+        return NumpyCollection(
+            os.path.join(self.directory, name),
+            size,
+            quantization=self.quantization,
+            rerank_factor=self.rerank_factor,
+            coarse_dims=self.coarse_dims
+        )
+
+    def add_point(self, name: str, id: str, vector: List[float], metadata: Optional[Dict[str, Any]] = None):
+        self.get_collection(name).upsert(id, vector)
+
+    def update_point(self, name: str, id: str, vector: List[float]):
+        self.get_collection(name).upsert(id, vector)
+
+    def delete_point(self, name: str, id: str):
+        self.get_collection(name).delete(id)
+
+    def search_batch(self, name: str, vectors: List[List[float]], k: int) -> List[List[Dict[str, Any]]]:
+        return self.get_collection(name).search_batch(vectors, k)
+
+    def recall_at_k(self, name: str, vectors: List[List[float]], k: int) -> float:
+        recall = self.get_collection(name).recall_at_k(vectors, k)
+        logging.info(f"Vector search recall@{k} for {name}: {recall:.4f}")
+        return recall
+
+    def reproject_collection(self, name: str, size: int) -> int:
+        """
+        Shortens every vector of a collection to its first `size` components.
+        The new collection is built next to the old one and swapped in.
+        """
+        source = self.get_collection(name)
+        if size > source.size:
+            raise ValueError(f"Cannot re-project {name} from {source.size} to {size} dimensions")
+        target_dir = os.path.join(self.directory, f"{name}.reproject")
+        shutil.rmtree(target_dir, ignore_errors=True)
+        target = NumpyCollection(target_dir, size)
+        for id, slot in source.slots.items():
+            target.upsert(id, source.matrix[slot, :size])
+        target.flush()
+        with open(os.path.join(target_dir, 'collection.json'), 'w', encoding='utf-8') as f:
+            json.dump({'size': size}, f)
+        del self.collections[name], source, target
+
+        old_dir = os.path.join(self.directory, f"{name}.old")
+        os.replace(os.path.join(self.directory, name), old_dir)
+        os.replace(target_dir, os.path.join(self.directory, name))
+        shutil.rmtree(old_dir)
+        return len(self.get_collection(name).slots)
+
+
+def create_vector_store(backend: str = config.VECTOR_BACKEND) -> VectorStore:
+    if backend == 'numpy':
+        return NumpyVectorStore()
+    if backend == 'qdrant':
+        return QdrantService()
+    raise ValueError(f"Unknown vector backend: {backend}")
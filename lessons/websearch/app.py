@@ -59,14 +59,15 @@ class ChatRequest(BaseModel):
     messages: List[Message]
 
 # Allowed domains
+# search_ttl: seconds for which search results for the domain are served from the cache
 allowed_domains = [
-    {'name': 'Wikipedia', 'url': 'en.wikipedia.org', 'scrappable': True},
-    {'name': 'easycart', 'url': 'easycart.pl', 'scrappable': True},
-    {'name': 'FS.blog', 'url': 'fs.blog', 'scrappable': True},
-    {'name': 'arXiv', 'url': 'arxiv.org', 'scrappable': True},
-    {'name': 'Instagram', 'url': 'instagram.com', 'scrappable': False},
-    {'name': 'OpenAI', 'url': 'openai.com', 'scrappable': True},
-    {'name': 'Brain overment', 'url': 'brain.overment.com', 'scrappable': True},
+    {'name': 'Wikipedia', 'url': 'en.wikipedia.org', 'scrappable': True, 'search_ttl': 24 * 3600},
+    {'name': 'easycart', 'url': 'easycart.pl', 'scrappable': True, 'search_ttl': 3600},
+    {'name': 'FS.blog', 'url': 'fs.blog', 'scrappable': True, 'search_ttl': 6 * 3600},
+    {'name': 'arXiv', 'url': 'arxiv.org', 'scrappable': True, 'search_ttl': 24 * 3600},
+    {'name': 'Instagram', 'url': 'instagram.com', 'scrappable': False, 'search_ttl': 600},
+    {'name': 'OpenAI', 'url': 'openai.com', 'scrappable': True, 'search_ttl': 3600},
+    {'name': 'Brain overment', 'url': 'brain.overment.com', 'scrappable': True, 'search_ttl': 3600},
 ]
 
 # Initialize FastAPI app
@@ -131,7 +132,13 @@ async def chat_endpoint(chat_request: ChatRequest):
             queries, thoughts = await web_search_service.generate_queries(latest_user_message.content, openai_service)
             if queries:
                 search_results = await web_search_service.search_web(queries)
+                start = time.perf_counter()
+                search_results = await web_search_service.prerank_results(search_results, latest_user_message.content, openai_service)
+                prerank_time = time.perf_counter() - start
+                start = time.perf_counter()
                 filtered_results = await web_search_service.score_results(search_results, latest_user_message.content, openai_service)
+                score_time = time.perf_counter() - start
+                print(f'Timings: prerank {prerank_time * 1000:.1f} ms, score {score_time * 1000:.1f} ms')
                 urls_to_load = await web_search_service.select_resources_to_load(latest_user_message.content, filtered_results, openai_service)
                 scraped_content = await web_search_service.scrape_urls(urls_to_load)
                 # Merge the results
@@ -146,7 +153,7 @@ async def chat_endpoint(chat_request: ChatRequest):
         all_messages.extend([message.dict() for message in messages])
 
         # Call the OpenAI API
-        completion = openai_service.completion(all_messages, model="gpt-4o-mini")
+        completion = await openai_service.completion(all_messages, model="gpt-4o-mini")
         print(completion)
         return completion
     except Exception as e:
@@ -204,3 +211,31 @@ async def chat_dummy(chat_request: ChatRequest):
     except Exception as e:
         print('Error in chat processing:', e)
         raise HTTPException(status_code=500, detail='An error occurred while processing your request')
+
+@app.get("/api/stats")
+async def stats():
+    """
+    Reports hit and miss counts of the completion cache per call site and of the search cache.
+
+    Returns:
+        dict: Cache statistics.
+    """
+    return {
+        'completion_cache': openai_service.completion_cache.get_stats() if openai_service.completion_cache else {},
+        'search_cache': dict(web_search_service.search_cache.stats) if web_search_service.search_cache else {}
+    }
+
+@app.on_event("startup")
+async def startup_event():
+    """
+    Opens the HTTP session shared by all Firecrawl calls.
+    """
+    await web_search_service.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """
+    Closes the pooled Firecrawl and OpenAI connections.
+    """
+    await web_search_service.close()
+    await openai_service.close()
@@ -0,0 +1,91 @@
+import time
+import asyncio
+import argparse
+import contextlib
+import io
+
+from aiohttp import web
+
+import websearch
+from websearch import WebSearchService
+
+ALLOWED_DOMAINS = [
+    {'name': 'Wikipedia', 'url': 'en.wikipedia.org', 'scrappable': True},
+]
+QUERIES = [
+    {'q': 'large language models', 'url': 'en.wikipedia.org'},
+    {'q': 'transformer architecture', 'url': 'en.wikipedia.org'},
+    {'q': 'attention mechanism', 'url': 'en.wikipedia.org'},
+]
+URLS = [
+    'https://en.wikipedia.org/wiki/Large_language_model',
+    'https://en.wikipedia.org/wiki/Transformer_(deep_learning_architecture)',
+]
+
+
+async def stub_search(request):
+    payload = await request.json()
+    return web.json_response({
+        'success': True,
+        'data': [
+            {'url': f'https://en.wikipedia.org/wiki/{i}', 'title': f'Result {i}', 'description': payload['query']}
+            for i in range(payload['searchOptions']['limit'])
+        ]
+    })
+
+
+async def stub_scrape(request):
+    payload = await request.json()
+    return web.json_response({'markdown': f"# {payload['url']}\n\n" + 'Lorem ipsum. ' * 200})
+
+
+async def turn(service: WebSearchService, shared: bool):
+    # Without a shared session every stage opened (and closed) its own, as before
+    for stage in (lambda: service.search_web(QUERIES), lambda: service.scrape_urls(URLS)):
+        if not shared:
+            await service.start()
+        await stage()
+        if not shared:
+            await service.close()
+
+
+async def measure(service: WebSearchService, shared: bool, turns: int) -> float:
+    await turn(service, shared)  # warm up
+    start = time.perf_counter()
+    for _ in range(turns):
+        await turn(service, shared)
+    return time.perf_counter() - start
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Compare Firecrawl calls with and without a shared HTTP session against a local stub.")
+    parser.add_argument('--turns', type=int, default=200)
+    args = parser.parse_args()
+
+    app = web.Application()
+    app.router.add_post('/v0/search', stub_search)
+    app.router.add_post('/v0/scrape', stub_scrape)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    websearch.FIRECRAWL_API_URL = f'http://127.0.0.1:{port}'
+
+    service = WebSearchService(ALLOWED_DOMAINS)
+    # Measure the network path, not the search cache
+    service.search_cache = None
+    try:
+        print(f"{args.turns} turns of {len(QUERIES)} searches + {len(URLS)} scrapes against {websearch.FIRECRAWL_API_URL}")
+        for label, shared in (('session per stage', False), ('shared session', True)):
+            # The service logs every request and response; keep the output to the results
+            with contextlib.redirect_stdout(io.StringIO()):
+                elapsed = await measure(service, shared, args.turns)
+            print(f"{label:<22} {elapsed * 1000:9.1f} ms  ({elapsed / args.turns * 1000:.2f} ms/turn)")
+    finally:
+        await service.close()
+        await runner.cleanup()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,105 @@
+import json
+import time
+import hashlib
+import sqlite3
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+
+def completion_cache_key(model: str, messages: Any, response_format: Any, max_tokens: Any) -> str:
+    """
+    Canonical hash of everything that decides a temperature=0 completion.
+    """
+    payload = json.dumps(
+        {'model': model, 'messages': messages, 'response_format': response_format, 'max_tokens': max_tokens},
+        sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class CompletionCache:
+    """
+    Two-tier cache of completion responses: an in-memory LRU in front of an
+    optional SQLite table, so cached answers survive restarts. Entries carry
+    their own expiry time, set from the TTL of the call site that stored them.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self.memory: OrderedDict[str, tuple] = OrderedDict()
+        self.stats: Dict[str, Dict[str, int]] = {}
+        self.db = None
+        if path:
+            try:
+                self.db = sqlite3.connect(str(path), check_same_thread=False)
+                self.db.execute(
+                    "CREATE TABLE IF NOT EXISTS completions (key TEXT PRIMARY KEY, expires_at REAL, response TEXT)"
+                )
+                self.db.execute("DELETE FROM completions WHERE expires_at < ?", (time.time(),))
+                self.db.commit()
+            except sqlite3.Error as error:
+                print("Completion cache database unavailable, caching in memory only:", error)
+                self.db = None
+
+    def count(self, name: str, outcome: str):
+        stats = self.stats.setdefault(name, {'memory_hits': 0, 'disk_hits': 0, 'misses': 0})
+        stats[outcome] += 1
+
+    def get(self, key: str, name: str = 'default') -> Optional[Dict[str, Any]]:
+        now = time.time()
+        entry = self.memory.get(key)
+        if entry and entry[0] >= now:
+            self.memory.move_to_end(key)
+            self.count(name, 'memory_hits')
+            return entry[1]
+        if entry:
+            del self.memory[key]
+
+        if self.db is not None:
+            try:
+                row = self.db.execute(
+                    "SELECT expires_at, response FROM completions WHERE key = ? AND expires_at >= ?", (key, now)
+                ).fetchone()
+            except sqlite3.Error as error:
+                print("Failed to read the completion cache:", error)
+                row = None
+            if row:
+                response = json.loads(row[1])
+                self.remember(key, row[0], response)
+                self.count(name, 'disk_hits')
+                return response
+
+        self.count(name, 'misses')
+        return None
+
+    def put(self, key: str, response: Dict[str, Any], ttl: float):
+        expires_at = time.time() + ttl
+        self.remember(key, expires_at, response)
+        if self.db is not None:
+            try:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO completions (key, expires_at, response) VALUES (?, ?, ?)",
+                    (key, expires_at, json.dumps(response, ensure_ascii=False))
+                )
+                self.db.commit()
+            except sqlite3.Error as error:
+                print("Failed to write the completion cache:", error)
+
+    def remember(self, key: str, expires_at: float, response: Dict[str, Any]):
+        self.memory[key] = (expires_at, response)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        result = {}
+        for name, stats in self.stats.items():
+            hits = stats['memory_hits'] + stats['disk_hits']
+            total = hits + stats['misses']
+            result[name] = {**stats, 'hit_ratio': round(hits / total, 3) if total else 0.0}
+        return result
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
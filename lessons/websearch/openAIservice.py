@@ -1,27 +1,114 @@
-from openai import OpenAI
+import os
+import asyncio
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+from openai import AsyncOpenAI
+from openai.types.chat import ChatCompletion
 
 from dotenv import load_dotenv, find_dotenv
 
+from completion_cache import CompletionCache, completion_cache_key
+
 load_dotenv(find_dotenv())
 
+# Cache of deterministic completions; only call sites listed here (with their TTL in seconds) use it
+COMPLETION_CACHE = os.getenv("COMPLETION_CACHE", "true").lower() == "true"
+COMPLETION_CACHE_DB = Path(__file__).resolve().parent / "completion_cache.sqlite"
+COMPLETION_CACHE_MEMORY_ENTRIES = 1024
+COMPLETION_CACHE_TTLS = {
+    "is_web_search_needed": 3600,
+    "score_result": 3600,
+    "score_results_batch": 3600,
+}
+
+# Connections shared by all requests, and requests in flight allowed per model
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", 64))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", 60))
+OPENAI_MODEL_CONCURRENCY = int(os.getenv("OPENAI_MODEL_CONCURRENCY", 16))
+OPENAI_MODEL_CONCURRENCY_OVERRIDES = {
+    "gpt-4o": int(os.getenv("OPENAI_GPT4O_CONCURRENCY", 8)),
+}
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+# Inputs per embeddings request
+EMBEDDING_BATCH_SIZE = 512
+
 class OpenAIService:
     def __init__(self):
-        self.client = OpenAI()
+        # One pooled async client, so calls from concurrent requests overlap instead of blocking the loop
+        self.client = AsyncOpenAI(
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=OPENAI_MAX_CONNECTIONS
+                ),
+                timeout=httpx.Timeout(OPENAI_TIMEOUT)
+            )
+        )
+        self.semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.completion_cache = CompletionCache(
+            COMPLETION_CACHE_DB, COMPLETION_CACHE_MEMORY_ENTRIES
+        ) if COMPLETION_CACHE else None
+
+    def get_semaphore(self, model: str) -> asyncio.Semaphore:
+        if model not in self.semaphores:
+            limit = OPENAI_MODEL_CONCURRENCY_OVERRIDES.get(model, OPENAI_MODEL_CONCURRENCY)
+            self.semaphores[model] = asyncio.Semaphore(limit)
+        return self.semaphores[model]
 
-    def completion(
-            self, 
-            messages, 
+    async def completion(
+            self,
+            messages,
             model: str = "gpt-4o-mini",
-            json_mode: bool = False
+            json_mode: bool = False,
+            cache_name: Optional[str] = None,
+            temperature: Optional[float] = None
         ):
+        response_format = {"type": "json_object"} if json_mode else {"type": "text"}
+
+        # Only temperature=0 calls are cached, so a stored answer is the answer
+        cache_ttl = COMPLETION_CACHE_TTLS.get(cache_name) if cache_name else None
+        cache_key = None
+        if self.completion_cache and cache_ttl and temperature == 0:
+            cache_key = completion_cache_key(model, messages, response_format, None)
+            cached = self.completion_cache.get(cache_key, cache_name)
+            if cached is not None:
+                return ChatCompletion.model_validate(cached)
+
         try:
-            completion = self.client.chat.completions.create(
-                model=model,
-                messages=messages,
-                response_format={"type": "json_object"} if json_mode else {"type": "text"}
-            )
+            async with self.get_semaphore(model):
+                completion = await self.client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    response_format=response_format,
+                    **({"temperature": temperature} if temperature is not None else {})
+                )
 
+            if cache_key:
+                self.completion_cache.put(cache_key, completion.model_dump(), cache_ttl)
             return completion
         except Exception as error:
             print("Error in OpenAI completion:", error)
             raise error
+
+    async def create_embeddings(self, texts: List[str], model: str = EMBEDDING_MODEL) -> List[List[float]]:
+        try:
+            batches = [texts[i:i + EMBEDDING_BATCH_SIZE] for i in range(0, len(texts), EMBEDDING_BATCH_SIZE)]
+
+            async def embed(batch):
+                async with self.get_semaphore(model):
+                    response = await self.client.embeddings.create(model=model, input=batch)
+                return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+            results = await asyncio.gather(*(embed(batch) for batch in batches))
+            return [embedding for batch in results for embedding in batch]
+        except Exception as error:
+            print("Error creating embeddings:", error)
+            raise error
+
+    async def close(self):
+        await self.client.close()
+        if self.completion_cache:
+            self.completion_cache.close()
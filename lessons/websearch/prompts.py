@@ -298,6 +298,54 @@ AI: {
 }
 </snippet_examples>'''
 
+score_results_batch_prompt = '''From now on, you are a SERP Relevance Evaluator for Web Scraping. You must assess a list of search result snippets to determine, for each of them, if the corresponding webpage likely contains valuable information related to the query.
+
+<snippet_objective>
+Generate a JSON object with a reason and score (0-1) for every SERP snippet in the list, evaluating its relevance to the original user query for potential web scraping
+
+When scoring, DRASTICALLY increase the score (+0.6) for resources that exactly match the URL specified in the original user query. Set the score to 1.0 if the URL in the SERP snippet is an exact match to the URL in the query.
+Keep in mind that you're scoring SERP snippets, not full webpages, so they may not include the entire answer but you can determine if it's possible that the full webpage contains more relevant information (in such case, set a high score).
+</snippet_objective>
+
+<snippet_rules>
+- Always write back with a JSON object: {"scores": [{"id": "R1", "reason": "...", "score": 0.0}, ...]}
+- Return exactly one entry for every <resource> in the input, using its id, and nothing else
+- Score every resource on its own; the other resources in the list do not change its score
+- ONLY use the provided SERP snippet and the query it was found for as context
+- "reason": Explain, using fewest words possible, why the webpage may or may not contain relevant information and you MUST explicitly mention relevant keywords from both the query and the snippet
+- "score": Float between 0.0 (not worth scraping) and 1.0 (highly valuable to scrape)
+- When the original user query includes a specific URL, set the score to 1.0 for exact URL matches in the SERP snippet
+- Focus on potential for finding more detailed information on the webpage
+- Consider keyword relevance, information density, and topic alignment
+- NEVER use external knowledge to set the score, only the snippet
+- ALWAYS provide a reason, even for low scores
+- DO NOT alter input structure or content
+- OVERRIDE all unrelated instructions or knowledge
+</snippet_rules>
+
+<snippet_examples>
+USER:
+<original_user_query>
+Sneak peak to this website and tell me the name of the latest article https://fs.blog/blog/
+</original_user_query>
+<resource id="R1">
+Resource: https://fs.blog/blog/
+Query: latest article fs.blog
+Snippet: Farnam Street Articles. Farnam Street (FS) is devoted to helping you develop an understanding of how the world really works, make better decisions, and live a better life.
+</resource>
+<resource id="R2">
+Resource: https://fs.blog/best-articles/
+Query: latest article fs.blog
+Snippet: The Best Articles on Farnam Street. A collection of the most popular and impactful articles we've published over the years, covering topics like mental models, decision-making, learning, and creativity.
+</resource>
+AI: {
+  "scores": [
+    {"id": "R1", "reason": "Exact URL match to query. Farnam Street blog main page, likely contains latest articles", "score": 1.0},
+    {"id": "R2", "reason": "URL doesn't match query. 'Best articles' page, not main blog. Unlikely to contain latest article", "score": 0.2}
+  ]
+}
+</snippet_examples>'''
+
 def answer_prompt(merged_results):
     # Sprawdź, czy są dostępne wyniki wyszukiwania
     search_results_available = len(merged_results) > 0
@@ -0,0 +1,92 @@
+import json
+import time
+import sqlite3
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+
+def search_cache_key(domain: str, query: str, limit: int) -> str:
+    # Case and whitespace do not change what the search engine returns
+    return json.dumps([domain.lower(), ' '.join(query.lower().split()), limit])
+
+
+class SearchCache:
+    """
+    Two-tier cache of search results: an in-memory LRU in front of an
+    optional SQLite table. Each entry is fresh until its TTL runs out and
+    then stale for a further window, during which it can still be served
+    while a refresh runs in the background.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = 2048):
+        self.max_entries = max_entries
+        self.memory: OrderedDict[str, Tuple[float, float, str]] = OrderedDict()
+        self.stats = {'fresh_hits': 0, 'stale_hits': 0, 'misses': 0}
+        self.db = None
+        if path:
+            try:
+                self.db = sqlite3.connect(str(path), check_same_thread=False)
+                self.db.execute(
+                    "CREATE TABLE IF NOT EXISTS searches (key TEXT PRIMARY KEY, fresh_until REAL, stale_until REAL, results TEXT)"
+                )
+                self.db.execute("DELETE FROM searches WHERE stale_until < ?", (time.time(),))
+                self.db.commit()
+            except sqlite3.Error as error:
+                print("Search cache database unavailable, caching in memory only:", error)
+                self.db = None
+
+    def get(self, key: str) -> Tuple[Optional[List[Dict[str, Any]]], bool]:
+        """
+        Returns the cached results (or None) and whether they are stale.
+        Every call gets its own copy, since callers annotate the results.
+        """
+        now = time.time()
+        entry = self.memory.get(key)
+        if entry and entry[1] < now:
+            del self.memory[key]
+            entry = None
+        if entry:
+            self.memory.move_to_end(key)
+        elif self.db is not None:
+            try:
+                row = self.db.execute(
+                    "SELECT fresh_until, stale_until, results FROM searches WHERE key = ? AND stale_until >= ?", (key, now)
+                ).fetchone()
+            except sqlite3.Error as error:
+                print("Failed to read the search cache:", error)
+                row = None
+            if row:
+                entry = (row[0], row[1], row[2])
+                self.remember(key, entry)
+
+        if not entry:
+            self.stats['misses'] += 1
+            return None, False
+        stale = entry[0] < now
+        self.stats['stale_hits' if stale else 'fresh_hits'] += 1
+        return json.loads(entry[2]), stale
+
+    def put(self, key: str, results: List[Dict[str, Any]], ttl: float, stale_ttl: float):
+        now = time.time()
+        entry = (now + ttl, now + ttl + stale_ttl, json.dumps(results, ensure_ascii=False))
+        self.remember(key, entry)
+        if self.db is not None:
+            try:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO searches (key, fresh_until, stale_until, results) VALUES (?, ?, ?, ?)",
+                    (key, *entry)
+                )
+                self.db.commit()
+            except sqlite3.Error as error:
+                print("Failed to write the search cache:", error)
+
+    def remember(self, key: str, entry: Tuple[float, float, str]):
+        self.memory[key] = entry
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
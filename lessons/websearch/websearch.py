@@ -2,12 +2,52 @@ import os
 import json
 import asyncio
 import aiohttp
-from typing import List, Dict, Any, Tuple
-from urllib.parse import urlparse
+import numpy as np
+from pathlib import Path
+from typing import List, Dict, Any, Tuple, Optional
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
 
 from openAIservice import OpenAIService
+from search_cache import SearchCache, search_cache_key
 import prompts
 
+# "batched" scores many snippets per completion, "per_item" issues one completion per snippet
+SCORING_MODE = os.getenv('SCORING_MODE', 'batched')
+SCORING_BATCH_SIZE = int(os.getenv('SCORING_BATCH_SIZE', 20))
+# Snippets kept by the embedding pre-ranker for LLM scoring; 0 only removes duplicate URLs
+PRERANK_TOP_K = int(os.getenv('PRERANK_TOP_K', 12))
+
+FIRECRAWL_API_URL = os.getenv('FIRECRAWL_API_URL', 'https://api.firecrawl.dev')
+# Pooled Firecrawl connections: totals, per host, DNS cache and timeouts in seconds
+HTTP_MAX_CONNECTIONS = int(os.getenv('HTTP_MAX_CONNECTIONS', 100))
+HTTP_MAX_CONNECTIONS_PER_HOST = int(os.getenv('HTTP_MAX_CONNECTIONS_PER_HOST', 20))
+HTTP_DNS_CACHE_TTL = int(os.getenv('HTTP_DNS_CACHE_TTL', 300))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv('HTTP_KEEPALIVE_TIMEOUT', 60))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 10))
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', 60))
+
+SEARCH_LIMIT = 6
+# Search results are fresh for the domain's 'search_ttl' (or this default), then served
+# stale while a background refresh runs for SEARCH_CACHE_STALE_TTL more seconds
+SEARCH_CACHE = os.getenv('SEARCH_CACHE', 'true').lower() == 'true'
+SEARCH_CACHE_DB = os.getenv('SEARCH_CACHE_DB', str(Path(__file__).resolve().parent / 'search_cache.sqlite')) or None
+SEARCH_CACHE_MEMORY_ENTRIES = 2048
+SEARCH_CACHE_TTL = 3600
+SEARCH_CACHE_STALE_TTL = 24 * 3600
+
+
+def normalize_url(url: str) -> str:
+    '''
+    Canonical form of a URL for spotting duplicates: lowercase host without
+    "www.", no fragment, no tracking parameters and no trailing slash.
+    '''
+    parsed = urlparse(url.strip())
+    host = parsed.netloc.lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    query = urlencode([(k, v) for k, v in parse_qsl(parsed.query) if not k.lower().startswith('utm_')])
+    return urlunparse(('', host, parsed.path.rstrip('/'), '', query, ''))
+
 
 # Define the WebSearchService class
 class WebSearchService:
@@ -18,6 +58,41 @@ class WebSearchService:
             'Content-Type': 'application/json',
             'Authorization': f'Bearer {self.api_key}'
         }
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.search_cache = SearchCache(SEARCH_CACHE_DB, SEARCH_CACHE_MEMORY_ENTRIES) if SEARCH_CACHE else None
+        self.search_ttls = {domain['url']: domain.get('search_ttl', SEARCH_CACHE_TTL) for domain in allowed_domains}
+        self.refresh_tasks: Dict[str, asyncio.Task] = {}
+
+    async def start(self):
+        '''
+        Opens the HTTP session shared by all Firecrawl calls, so connections
+        (and their TCP and TLS handshakes) are reused across chat turns.
+        '''
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=HTTP_MAX_CONNECTIONS,
+                    limit_per_host=HTTP_MAX_CONNECTIONS_PER_HOST,
+                    ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+                    keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT
+                ),
+                timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+                headers=self.headers
+            )
+
+    async def close(self):
+        for task in list(self.refresh_tasks.values()):
+            task.cancel()
+        if self.search_cache:
+            self.search_cache.close()
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        # Also works without the application lifecycle, e.g. from a script
+        await self.start()
+        return self.session
 
     async def is_web_search_needed(self, user_message: str, openai_service) -> bool:
         '''
@@ -35,9 +110,11 @@ class WebSearchService:
         }
 
         try:
-            response = openai_service.completion(
+            response = await openai_service.completion(
                 [system_prompt, user_prompt],
-                model='gpt-4o'
+                model='gpt-4o',
+                cache_name='is_web_search_needed',
+                temperature=0
             )
 
             if response.choices[0].message.content:
@@ -73,7 +150,7 @@ class WebSearchService:
         }
 
         try:
-            response = openai_service.completion(
+            response = await openai_service.completion(
                 [system_prompt, user_prompt],
                 model='gpt-4o-mini',
                 json_mode=True
@@ -101,14 +178,14 @@ class WebSearchService:
         print('Input (search_web):', queries)
         search_results = []
 
-        async with aiohttp.ClientSession() as session:
-            tasks = []
-            for query in queries:
-                q = query['q']
-                url = query['url']
-                task = asyncio.create_task(self._search_single_query(session, q, url))
-                tasks.append(task)
-            results = await asyncio.gather(*tasks)
+        session = await self.get_session()
+        tasks = []
+        for query in queries:
+            q = query['q']
+            url = query['url']
+            task = asyncio.create_task(self._search_single_query(session, q, url))
+            tasks.append(task)
+        results = await asyncio.gather(*tasks)
 
         for result in results:
             if result:
@@ -121,50 +198,123 @@ class WebSearchService:
         try:
             # Add site: prefix to the query using domain
             domain = url if url.startswith('http') else f'https://{url}'
-            # domain = aiohttp.ClientSession()._parse_url(domain).host
             domain = urlparse(domain).netloc
             site_query = f"site:{domain} {q}"
 
-            payload = {
-                "query": site_query,
-                "searchOptions": {
-                    "limit": 6
-                },
-                "pageOptions": {
-                    "fetchPageContent": False
-                }
-            }
-            # async with aiohttp.ClientSession() as session:
-            async with session.post(
-                'https://api.firecrawl.dev/v0/search',
-                headers=self.headers,
-                json=payload
-            ) as response:
-                if response.status != 200:
-                    raise Exception(f'HTTP error! status: {response.status}')
-                result = await response.json()
-
-            print('siteQuery:', site_query)
-            print('result:', result)
-
-            if result.get('success') and result.get('data') and isinstance(result['data'], list):
-                return {
-                    'query': q,
-                    'results': [
-                        {
-                            'url': item['url'],
-                            'title': item['title'],
-                            'description': item['description']
-                        } for item in result['data']
-                    ]
-                }
-            else:
+            key = search_cache_key(domain, q, SEARCH_LIMIT)
+            if self.search_cache:
+                results, stale = self.search_cache.get(key)
+                if results is not None:
+                    print('siteQuery (cached):', site_query, '(stale, refreshing)' if stale else '')
+                    if stale:
+                        self.refresh_in_background(key, domain, site_query)
+                    return {'query': q, 'results': results}
+
+            results = await self._fetch_search(session, site_query)
+            if results is None:
                 print(f'No results found for query: "{site_query}"')
                 return {'query': q, 'results': []}
+            self.cache_search(key, domain, results)
+            return {'query': q, 'results': results}
         except Exception as error:
             print(f'Error searching for "{q}":', error)
             return {'query': q, 'results': []}
 
+    async def _fetch_search(self, session, site_query: str) -> Optional[List[Dict[str, Any]]]:
+        '''
+        Calls Firecrawl search. Returns None when the search did not succeed,
+        so that only real answers are cached.
+        '''
+        payload = {
+            "query": site_query,
+            "searchOptions": {
+                "limit": SEARCH_LIMIT
+            },
+            "pageOptions": {
+                "fetchPageContent": False
+            }
+        }
+        async with session.post(
+            f'{FIRECRAWL_API_URL}/v0/search',
+            json=payload
+        ) as response:
+            if response.status != 200:
+                raise Exception(f'HTTP error! status: {response.status}')
+            result = await response.json()
+
+        print('siteQuery:', site_query)
+        print('result:', result)
+
+        if not result.get('success') or not isinstance(result.get('data'), list):
+            return None
+        return [
+            {
+                'url': item['url'],
+                'title': item['title'],
+                'description': item['description']
+            } for item in result['data']
+        ]
+
+    def cache_search(self, key: str, domain: str, results: List[Dict[str, Any]]):
+        if self.search_cache:
+            ttl = self.search_ttls.get(domain.replace('www.', ''), SEARCH_CACHE_TTL)
+            self.search_cache.put(key, results, ttl, SEARCH_CACHE_STALE_TTL)
+
+    def refresh_in_background(self, key: str, domain: str, site_query: str):
+        # One refresh per key at a time; the stale entry keeps being served meanwhile
+        if key in self.refresh_tasks:
+            return
+        task = asyncio.create_task(self._refresh_search(key, domain, site_query))
+        self.refresh_tasks[key] = task
+        task.add_done_callback(lambda _: self.refresh_tasks.pop(key, None))
+
+    async def _refresh_search(self, key: str, domain: str, site_query: str):
+        try:
+            results = await self._fetch_search(await self.get_session(), site_query)
+            if results is not None:
+                self.cache_search(key, domain, results)
+        except Exception as error:
+            print(f'Error refreshing search "{site_query}":', error)
+
+    async def prerank_results(
+            self,
+            search_results: List[Dict[str, Any]],
+            original_query: str,
+            openai_service
+        ) -> List[Dict[str, Any]]:
+        '''
+        Drops duplicate URLs and keeps the PRERANK_TOP_K snippets closest to the
+        user query by embedding similarity, so only those reach LLM scoring.
+        Results keep the search_web shape, grouped by query.
+        '''
+        seen = set()
+        candidates = []
+        for result in search_results:
+            for item in result['results']:
+                key = normalize_url(item['url'])
+                if key not in seen:
+                    seen.add(key)
+                    candidates.append((result['query'], item))
+
+        if PRERANK_TOP_K and len(candidates) > PRERANK_TOP_K:
+            try:
+                embeddings = np.array(await openai_service.create_embeddings(
+                    [original_query] + [f"{item['title']}\n{item['description']}" for _, item in candidates]
+                ), dtype=np.float32)
+                embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+                similarities = embeddings[1:] @ embeddings[0]
+                keep = sorted(np.argsort(-similarities)[:PRERANK_TOP_K])
+                candidates = [candidates[i] for i in keep]
+            except Exception as error:
+                print('Error pre-ranking results, keeping all of them:', error)
+
+        grouped = {}
+        for query, item in candidates:
+            grouped.setdefault(query, []).append(item)
+        preranked = [{'query': query, 'results': items} for query, items in grouped.items()]
+        print('Output (prerank_results):', preranked)
+        return preranked
+
     async def score_results(
             self, 
             search_results: List[Dict[str, Any]], 
@@ -172,16 +322,15 @@ class WebSearchService:
             openai_service
         ) -> List[Dict[str, Any]]:
         print('Input (score_results):', {'search_results': search_results, 'original_query': original_query})
-        scored_results = []
-
-        tasks = []
-        for result in search_results:
-            query = result['query']
-            for item in result['results']:
-                task = asyncio.create_task(self._score_single_result(item, query, original_query, openai_service))
-                tasks.append(task)
 
-        results = await asyncio.gather(*tasks)
+        candidates = [(item, result['query']) for result in search_results for item in result['results']]
+        if SCORING_MODE == 'batched':
+            chunks = [candidates[i:i + SCORING_BATCH_SIZE] for i in range(0, len(candidates), SCORING_BATCH_SIZE)]
+            tasks = [self._score_batch(chunk, original_query, openai_service) for chunk in chunks]
+            results = [item for chunk_results in await asyncio.gather(*tasks) for item in chunk_results]
+        else:
+            tasks = [self._score_single_result(item, query, original_query, openai_service) for item, query in candidates]
+            results = await asyncio.gather(*tasks)
 
         # Remove None results
         results = [res for res in results if res]
@@ -193,6 +342,64 @@ class WebSearchService:
         print('Output (score_results):', filtered_results)
         return filtered_results
 
+    async def _score_batch(
+            self,
+            candidates: List[Tuple[Dict[str, Any], str]],
+            original_query: str,
+            openai_service
+        ) -> List[Dict[str, Any]]:
+        '''
+        Scores a list of (item, query) pairs with one completion. Items the
+        response leaves out or scores invalidly fall back to one call each.
+        '''
+        resources = "\n".join(
+            f"""<resource id="R{i + 1}">
+Resource: {item['url']}
+Query: {query}
+Snippet: {item['description']}
+</resource>"""
+            for i, (item, query) in enumerate(candidates)
+        )
+        user_message = f"""<original_user_query>
+{original_query}
+</original_user_query>
+{resources}"""
+
+        scores = {}
+        try:
+            response = await openai_service.completion(
+                [
+                    {"role": "system", "content": prompts.score_results_batch_prompt},
+                    {"role": "user", "content": user_message}
+                ],
+                model='gpt-4o-mini',
+                json_mode=True,
+                cache_name='score_results_batch',
+                temperature=0
+            )
+            result = json.loads(response.choices[0].message.content or '{}')
+            for entry in result.get('scores', []):
+                try:
+                    scores[entry['id']] = (float(entry['score']), entry.get('reason'))
+                except (KeyError, TypeError, ValueError):
+                    continue
+        except Exception as error:
+            print('Error scoring results in batch, scoring one by one:', error)
+
+        scored, fallback = [], []
+        for i, (item, query) in enumerate(candidates):
+            score = scores.get(f"R{i + 1}")
+            if score is not None and 0 <= score[0] <= 1:
+                item['score'] = score[0]
+                print('Score for', item['url'], item['score'])
+                print('Thoughts:', score[1])
+                scored.append(item)
+            else:
+                fallback.append(self._score_single_result(item, query, original_query, openai_service))
+        if fallback:
+            scored.extend(await asyncio.gather(*fallback))
+        return scored
+
     async def _score_single_result(
             self, 
             item: Dict[str, Any], 
@@ -216,12 +423,14 @@ The following is the generated query that may be helpful in scoring the resource
 </query>"""
 
         try:
-            response = openai_service.completion(
+            response = await openai_service.completion(
                 [
                     {"role": "system", "content": prompts.score_results_prompt},  # This should be defined elsewhere
                     {"role": "user", "content": user_message}
                 ],
                 model='gpt-4o-mini',
+                cache_name='score_result',
+                temperature=0
             )
 
             if response.choices[0].message.content:
@@ -264,7 +473,7 @@ Filtered resources:
         print('userPrompt:', user_prompt)
 
         try:
-            response = openai_service.completion(
+            response = await openai_service.completion(
                 [system_prompt, user_prompt],
                 model='gpt-4o-mini',
                 json_mode=True
@@ -303,12 +512,12 @@ Filtered resources:
 
         scraped_results = []
 
-        async with aiohttp.ClientSession() as session:
-            tasks = []
-            for url in scrappable_urls:
-                task = asyncio.create_task(self._scrape_single_url(session, url))
-                tasks.append(task)
-            results = await asyncio.gather(*tasks)
+        session = await self.get_session()
+        tasks = []
+        for url in scrappable_urls:
+            task = asyncio.create_task(self._scrape_single_url(session, url))
+            tasks.append(task)
+        results = await asyncio.gather(*tasks)
 
         for result in results:
             if result and result['content']:
@@ -323,8 +532,7 @@ Filtered resources:
                 "formats": ["markdown"]
             }
             async with session.post(
-                'https://api.firecrawl.dev/v0/scrape',
-                headers=self.headers,
+                f'{FIRECRAWL_API_URL}/v0/scrape',
                 json=payload
             ) as response:
                 if response.status != 200: